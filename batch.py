@@ -0,0 +1,155 @@
+"""
+Solves many problem files in parallel: read_problem -> solve -> feasibility -> write_solution for every csv file in a
+directory (or matching a glob pattern), with one process per instance. The solutions are written to an output
+directory, together with a summary table (summary.csv) with the cost, lateness, number of setups and running time of
+each instance. An instance that fails is reported in the summary, and does not stop the others.
+
+    python batch.py "data/input/*.csv" --output data/output/batch --workers 4
+"""
+
+import argparse
+import collections
+import glob
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+
+from data_structures import *
+from greedy_partitioner import solve
+
+SUMMARY_COLUMNS = ["problem", "runs", "cost", "lateness_weeks", "late_runs", "setups", "feasible", "seconds",
+                   "solution", "error"]
+
+
+def problem_files(pattern: str) -> list[str]:
+    """Returns the csv files in the directory `pattern`, or the files matching the glob `pattern`, sorted by name."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.csv")
+    return sorted(glob.glob(pattern))
+
+
+def solution_stats(solution: Solution) -> dict:
+    """
+    Returns the parts of the cost of a complete solution: the total lateness in weeks, the number of late runs and the
+    number of setups on the slab caster.
+    """
+    problem = solution.problem
+    steps_c = problem.run_steps[:, 2]
+    end = np.array(solution.start, dtype=np.int64)[steps_c] + problem.step_length[steps_c]
+    late = np.maximum(0, end - problem.run_due)
+    metals = problem.run_metal[np.argsort(end, kind="stable")]
+    return {
+        "lateness_weeks": late.sum() / (7 * 24 * 3600),
+        "late_runs": int((late > 0).sum()),
+        "setups": int((metals[1:] != metals[:-1]).sum()),
+    }
+
+
+def run_file(task: tuple[str, str, dict]) -> dict:
+    """
+    Solves the problem in one file and writes its solution (in a worker process). Returns one row of the summary; if
+    anything fails, the row contains the error instead of the results.
+    """
+    filename, output_dir, options = task
+    row = {"problem": filename}
+    start = time.perf_counter()
+    try:
+        problem = read_problem(filename)
+        solution = solve(problem, **options)
+        row["runs"] = len(problem.run_due)
+        row["cost"] = solution.cost()
+        row.update(solution_stats(solution))
+        row["feasible"] = is_feasible(solution)
+        name = os.path.splitext(os.path.basename(filename))[0]
+        row["solution"] = os.path.join(output_dir, f"{name}_solution.csv")
+        write_solution(solution, row["solution"])
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def _run_file_process(task: tuple[str, str, dict], connection: multiprocessing.connection.Connection) -> None:
+    connection.send(run_file(task))
+    connection.close()
+
+
+def run_batch(pattern: str, output_dir: str, workers: int | None = None, timeout: float | None = None,
+              **options) -> pd.DataFrame:
+    """
+    Solves every problem file of `pattern` (see `problem_files`) with at most `workers` processes at a time (by default
+    one per CPU), and writes the solutions and the summary (summary.csv) to `output_dir`. The `options` are passed to
+    `solve`. Returns the summary, with one row per file in the order of the files.
+
+    Each file is solved in a process of its own, so a file that makes its process crash (for example when it is killed
+    for using too much memory) only fails that file. A process that takes longer than `timeout` seconds is killed.
+    """
+    files = problem_files(pattern)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count(), max(1, len(files)))
+
+    waiting = collections.deque(enumerate(files))
+    running = {}  # for each process sentinel: the index of the file, the process, its connection and its start time
+    rows = {}
+    while len(waiting) > 0 or len(running) > 0:
+        while len(waiting) > 0 and len(running) < workers:
+            index, filename = waiting.popleft()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_file_process, args=((filename, output_dir, options), sender),
+                                              daemon=True)
+            process.start()
+            sender.close()
+            running[process.sentinel] = (index, process, receiver, time.perf_counter())
+
+        wait = None
+        if timeout is not None:
+            wait = max(0.0, min(start for _, _, _, start in running.values()) + timeout - time.perf_counter())
+        finished = multiprocessing.connection.wait(list(running), wait)
+
+        now = time.perf_counter()
+        for sentinel, (index, process, receiver, start) in list(running.items()):
+            if sentinel in finished:
+                timed_out = False
+            elif timeout is not None and now - start >= timeout:
+                process.kill()
+                timed_out = True
+            else:
+                continue
+            process.join()
+            del running[sentinel]
+
+            # a process that died or was killed has not sent its row
+            try:
+                row = receiver.recv()
+            except EOFError:
+                if timed_out:
+                    error = f"timed out after {timeout}s"
+                else:
+                    error = f"the process died (exit code {process.exitcode})"
+                row = {"problem": files[index], "error": error, "seconds": now - start}
+            receiver.close()
+            rows[index] = row
+            status = "failed" if "error" in row else f"cost {row['cost']:.3f}"
+            print(f"{row['problem']}: {status} ({row['seconds']:.2f}s)", file=sys.stderr)
+
+    # (the integer columns are nullable, since failed instances have no results)
+    summary = pd.DataFrame([rows[i] for i in range(len(files))], columns=SUMMARY_COLUMNS)
+    summary = summary.astype({"runs": "Int64", "late_runs": "Int64", "setups": "Int64"})
+    summary.to_csv(os.path.join(output_dir, "summary.csv"), index=False)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("problems", help="directory with problem csv files, or a glob pattern")
+    parser.add_argument("--output", default="data/output/batch", help="directory to write the solutions to")
+    parser.add_argument("--workers", type=int, help="number of processes (default: one per CPU)")
+    parser.add_argument("--time-limit", type=float, help="time limit of the search of each instance in seconds")
+    parser.add_argument("--timeout", type=float, help="kill the process of an instance after this many seconds")
+    args = parser.parse_args()
+
+    summary = run_batch(args.problems, args.output, args.workers, args.timeout, time_limit=args.time_limit)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(summary.drop(columns=["solution", "error"]).to_string(index=False))
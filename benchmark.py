@@ -0,0 +1,140 @@
+"""
+Benchmark of the full pipeline read_problem -> solve -> Solution.cost -> feasibility -> write_solution on random
+instances of increasing size. For each stage the running time and peak memory are measured, and the results are
+written to a JSON file, so that runs on different commits can be compared:
+
+    python benchmark.py --sizes 100 1000 10000 --output bench_new.json --compare bench_old.json
+
+The instances are generated with `generate` from `data/input/TestData.py`, with a fixed seed.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+from data_structures import *
+from greedy_partitioner import solve
+
+STAGES = ["read_problem", "solve", "cost", "feasibility", "write_solution"]
+
+
+def load_generator():
+    """Imports `generate` from data/input/TestData.py (which is not part of a package)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "input", "TestData.py")
+    spec = importlib.util.spec_from_file_location("TestData", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.generate
+
+
+def generate_instance(num_runs: int, filename: str, seed: int = 0) -> None:
+    """Writes a random instance with `num_runs` runs (three metals, three peaks each, three due dates) to `filename`."""
+    generate = load_generator()
+    generate(num_runs, [3, 3, 3], 3, filename, seed=seed, chunksize=100000)
+
+
+def measure(function, memory: bool = True) -> tuple[object, dict]:
+    """
+    Calls `function` and returns its result together with the elapsed time in seconds and, if `memory` is set, the peak
+    memory in bytes that was allocated during the call (as traced by tracemalloc, which slows down the call somewhat).
+    Everything that is printed by `function` is discarded.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = function()
+    stats = {"seconds": time.perf_counter() - start}
+    if memory:
+        stats["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, stats
+
+
+def run_instance(num_runs: int, directory: str, seed: int = 0, memory: bool = True) -> dict:
+    """Generates an instance with `num_runs` runs and measures every stage of the pipeline on it."""
+    problem_csv = os.path.join(directory, f"problem_{num_runs}.csv")
+    solution_csv = os.path.join(directory, f"solution_{num_runs}.csv")
+    generate_instance(num_runs, problem_csv, seed)
+
+    stats = {}
+    problem, stats["read_problem"] = measure(lambda: read_problem(problem_csv), memory)
+    solution, stats["solve"] = measure(lambda: solve(problem), memory)
+    cost, stats["cost"] = measure(lambda: solution.cost(), memory)
+    feasible, stats["feasibility"] = measure(lambda: feasibility(solution), memory)
+    _, stats["write_solution"] = measure(lambda: write_solution(solution, solution_csv), memory)
+
+    return {"runs": len(problem.runs), "cost": cost, "feasible": feasible, "stages": stats}
+
+
+def run(sizes: list[int], seed: int = 0, memory: bool = True) -> dict:
+    """Runs the benchmark for every number of runs in `sizes`, and returns the results (including some metadata)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            result = run_instance(n, directory, seed, memory)
+            results.append(result)
+            times = ", ".join(f"{stage} {result['stages'][stage]['seconds']:.3f}s" for stage in STAGES)
+            print(f"{result['runs']} runs: {times}", file=sys.stderr)
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "seed": seed,
+        "memory": memory,
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 1.5) -> list[str]:
+    """
+    Compares two benchmark results instance by instance (matched by number of runs) and stage by stage. Returns one
+    line per stage, where stages that got slower by more than a factor `threshold` are marked as regressions.
+    """
+    old_results = {r["runs"]: r for r in old["results"]}
+    lines = []
+    for r in new["results"]:
+        if r["runs"] not in old_results:
+            continue
+        for stage in STAGES:
+            t_old = old_results[r["runs"]]["stages"][stage]["seconds"]
+            t_new = r["stages"][stage]["seconds"]
+            ratio = t_new / t_old if t_old > 0 else math.inf
+            mark = "  REGRESSION" if ratio > threshold else ""
+            lines.append(f"{r['runs']:>8} {stage:<15} {t_old:10.3f}s -> {t_new:10.3f}s  ({ratio:.2f}x){mark}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000],
+                        help="numbers of runs of the instances")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the instance generator")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure peak memory (faster)")
+    parser.add_argument("--output", default="bench_output.json", help="file to write the results to")
+    parser.add_argument("--compare", help="earlier results to compare with")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.seed, not args.no_memory)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), results)))
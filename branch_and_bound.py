@@ -0,0 +1,212 @@
+from data_structures import *
+from greedy_partitioner import apply_sequence, evaluate_sequence
+import math
+import time
+
+
+class BranchAndBoundResult:
+    """
+    A class representing the outcome of `branch_and_bound`.
+
+    Attributes:
+        solution: Solution | None
+            The best solution that was found (`None` if none was found within the limits)
+        cost: float
+            The cost of `solution` (infinity if there is none)
+        lower_bound: float
+            A proven lower bound on the cost of any schedule that is inferred from a sequence for the slab caster
+        nodes: int
+            The number of nodes of the search tree that were explored
+        optimal: bool
+            Whether the search was completed, in which case `solution` is optimal
+    """
+
+    def __init__(self, solution: Solution | None, cost: float, lower_bound: float, nodes: int, optimal: bool):
+        self.solution: Solution | None = solution
+        self.cost: float = cost
+        self.lower_bound: float = lower_bound
+        self.nodes: int = nodes
+        self.optimal: bool = optimal
+
+    def gap(self) -> float:
+        """Returns the relative gap between the cost of the best solution and the lower bound."""
+        if self.cost == 0:
+            return 0.0
+        return (self.cost - self.lower_bound) / self.cost
+
+
+def branch_and_bound(problem: Problem, time_limit: float | None = 10.0, initial: Solution | None = None) \
+        -> BranchAndBoundResult:
+    """
+    Finds an optimal sequence of runs for the slab caster by depth-first branch and bound. The schedules for machine A
+    and B are inferred from machine C, as in `sequence_to_schedule`, so the result can be compared directly to
+    `greedy_partitioner.solve`.
+
+    A node of the search tree is a prefix of the sequence. Runs that are indistinguishable (same metal, due date and
+    step lengths) are grouped into classes, and only one run of each class is branched on, which removes symmetric
+    sequences. A node is pruned if its lower bound (see `_lower_bound`) is not below the cost of the best sequence so
+    far. Children are explored in order of increasing lower bound.
+
+    Args:
+        problem: the problem instance
+        time_limit: the maximum running time in seconds, or `None` for no limit
+        initial: optionally, a solution whose sequence for the slab caster is used as the first upper bound
+
+    Returns: the best solution, the proven lower bound and the number of explored nodes, see BranchAndBoundResult
+    """
+
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    # group indistinguishable runs into classes
+    lengths = problem.step_length[problem.run_steps].tolist()
+    metals = problem.run_metal.tolist()
+    dues = problem.run_due.tolist()
+    class_of: dict[tuple, int] = {}
+    members: list[list[int]] = []
+    for r in range(len(dues)):
+        key = (metals[r], dues[r], *lengths[r])
+        if key not in class_of:
+            class_of[key] = len(members)
+            members.append([])
+        members[class_of[key]].append(r)
+    num_classes = len(members)
+    c_len = [lengths[rs[0]] for rs in members]
+    c_metal = [metals[rs[0]] for rs in members]
+    c_due = [dues[rs[0]] for rs in members]
+
+    # orders of the classes that are used by the lower bound
+    by_len_c = sorted(range(num_classes), key=lambda k: c_len[k][2])
+    by_due = sorted(range(num_classes), key=lambda k: c_due[k])
+
+    def bound(counts: list[int], state: tuple[int, int, int], metal: int | None) -> tuple[float, float]:
+        return _lower_bound(counts, state, metal, c_len, c_metal, c_due, by_len_c, by_due)
+
+    def sequence_of(prefix) -> list[Step]:
+        """Turns a linked list of classes into a sequence of steps for the slab caster."""
+        classes = []
+        while prefix is not None:
+            classes.append(prefix[0])
+            prefix = prefix[1]
+        classes.reverse()
+        used = [0] * num_classes
+        sequence = []
+        for k in classes:
+            sequence.append(problem.steps[problem.run_steps[members[k][used[k]], 2]])
+            used[k] += 1
+        return sequence
+
+    # upper bound from the initial solution
+    best_sequence: list[Step] | None = None
+    best_cost = math.inf
+    if initial is not None:
+        steps_c = [problem.steps[i] for i in problem.run_steps[:, 2].tolist()]
+        best_sequence = sorted(steps_c, key=lambda s: initial.start[s.index])
+        best_cost, _ = evaluate_sequence(best_sequence, Frontier())
+
+    # each entry of the stack is (lower bound, prefix, counts, end times, metal, lateness, setups)
+    # the prefix is a linked list (class, parent) of the classes in the sequence, in reverse order
+    root_counts = [len(rs) for rs in members]
+    root_late, root_setups = bound(root_counts, (0, 0, 0), None)
+    root_bound = root_late / (7 * 24 * 3600) + root_setups
+    stack = [(root_bound, None, root_counts, (0, 0, 0), None, 0, 0)]
+    nodes = 0
+    timed_out = False
+
+    while len(stack) > 0:
+        if deadline is not None and nodes % 256 == 0 and time.perf_counter() > deadline:
+            timed_out = True
+            break
+
+        lb, prefix, counts, state, metal, late, setups = stack.pop()
+        if lb >= best_cost:
+            continue
+        nodes += 1
+
+        if sum(counts) == 0:
+            # all runs are scheduled
+            best_cost = late / (7 * 24 * 3600) + setups
+            best_sequence = sequence_of(prefix)
+            continue
+
+        children = []
+        for k in range(num_classes):
+            if counts[k] == 0:
+                continue
+
+            # schedule one run of class k
+            a, b, c = state
+            length = c_len[k]
+            if metal is None:
+                # the first step on the slab caster may use the time before the end of the maintenance
+                c = 172800 - length[2]
+            setup = metal is not None and c_metal[k] != metal
+            a = a + length[0]
+            b = max(b, a) + length[1]
+            c = max(c, b) + length[2] + 3600 * setup
+            child_late = late + max(0, c - c_due[k])
+            child_setups = setups + setup
+
+            child_counts = counts.copy()
+            child_counts[k] -= 1
+            bound_late, bound_setups = bound(child_counts, (a, b, c), c_metal[k])
+            child_lb = (child_late + bound_late) / (7 * 24 * 3600) + child_setups + bound_setups
+            if child_lb < best_cost:
+                children.append((child_lb, (k, prefix), child_counts, (a, b, c), c_metal[k], child_late, child_setups))
+
+        # the child with the smallest lower bound is explored first
+        children.sort(key=lambda child: child[0], reverse=True)
+        stack.extend(children)
+
+    # the lower bound is the minimum over the best solution and all nodes that were not explored
+    lower_bound = max(root_bound, min([best_cost] + [entry[0] for entry in stack]))
+
+    solution = None
+    if best_sequence is not None:
+        solution = Solution(problem)
+        apply_sequence(solution, best_sequence, Frontier())
+
+    return BranchAndBoundResult(solution, best_cost, lower_bound, nodes, not timed_out)
+
+
+def _lower_bound(counts: list[int], state: tuple[int, int, int], metal: int | None,
+                 c_len: list[list[int]], c_metal: list[int], c_due: list[int],
+                 by_len_c: list[int], by_due: list[int]) -> tuple[float, float]:
+    """
+    Returns lower bounds on the lateness (in seconds) and the number of setups of the remaining runs (`counts[k]` runs
+    of class k), when they are scheduled after the end times `state` and the metal `metal` on the slab caster.
+
+    Setups: every remaining metal other than the current one (or the first one, if `metal` is `None`) needs at least
+    one setup.
+    Lateness: machine C can start the next step no earlier than `t0`, the earliest time any remaining run can reach it.
+    Relaxing to a single machine without setups, the k-th run finishes no earlier than `t0` plus the k shortest lengths
+    on machine C. Pairing these completion times with the due dates sorted in increasing order gives a lower bound on
+    the total lateness (which, in particular, accounts for the load of machine C).
+    """
+    remaining_metals = {c_metal[k] for k in range(len(counts)) if counts[k] > 0}
+    if len(remaining_metals) == 0:
+        return 0.0, 0
+    # if nothing is scheduled yet, the first metal needs no setup
+    setups = len(remaining_metals) - (metal is None or metal in remaining_metals)
+
+    a, b, c = state
+    if metal is None:
+        # nothing is scheduled yet, so the first step on the slab caster can end at the end of the maintenance
+        t0 = 172800 - max(c_len[k][2] for k in range(len(counts)) if counts[k] > 0)
+    else:
+        t0 = c
+    t0 = max(t0, min(max(b, a + c_len[k][0]) + c_len[k][1] for k in range(len(counts)) if counts[k] > 0))
+
+    completions = []
+    t = t0
+    for k in by_len_c:
+        for _ in range(counts[k]):
+            t += c_len[k][2]
+            completions.append(t)
+    late = 0
+    i = 0
+    for k in by_due:
+        for _ in range(counts[k]):
+            late += max(0, completions[i] - c_due[k])
+            i += 1
+
+    return late, setups
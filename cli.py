@@ -0,0 +1,157 @@
+"""
+Command line interface of the scheduler:
+
+    python cli.py solve data/input/data.csv -o solution.csv
+    python cli.py check data/input/data.csv solution.csv
+    python cli.py cost data/input/data.csv solution.csv
+    python cli.py convert data/input/TUEdatav1.xlsx -o data/input/data.csv
+    python cli.py batch "data/input/*.csv" --output data/output/batch
+    python cli.py bench --sizes 100 1000
+
+Each command only imports the modules it needs, so that short commands such as `check` start quickly.
+"""
+
+import argparse
+import sys
+
+
+def read(problem_csv: str, solution_csv: str | None = None, cache_dir: str | None = None):
+    """Reads the problem in `problem_csv` and, if given, its solution in `solution_csv`."""
+    from data_structures import read_problem, parse_solution
+    import pandas as pd
+
+    problem = read_problem(problem_csv, cache_dir)
+    if solution_csv is None:
+        return problem
+    return problem, parse_solution(problem, pd.read_csv(solution_csv))
+
+
+def cmd_solve(args: argparse.Namespace) -> int:
+    from data_structures import feasibility, write_solution
+    from greedy_partitioner import solve
+    from metrics import Metrics
+
+    problem = read(args.problem, cache_dir=args.cache_dir)
+    metrics = Metrics(verbose=args.verbose)
+    solution = solve(problem, workers=args.workers, metrics=metrics, time_limit=args.time_limit,
+                     interval_budget=args.interval_budget, max_clusters=args.max_clusters, search=args.search)
+    if args.improve > 0:
+        from local_search import improve
+        solution = improve(solution, time_limit=args.improve)
+
+    print(f"cost: {solution.cost()}")
+    feasible = feasibility(solution)
+    print(f"feasible: {feasible}")
+    if args.output is not None:
+        write_solution(solution, args.output)
+    if args.metrics is not None:
+        metrics.to_json(args.metrics)
+    return 0 if feasible else 1
+
+
+def cmd_check(args: argparse.Namespace) -> int:
+    from data_structures import feasibility
+
+    _, solution = read(args.problem, args.solution, args.cache_dir)
+    feasible = feasibility(solution)
+    print(f"feasible: {feasible}")
+    return 0 if feasible else 1
+
+
+def cmd_cost(args: argparse.Namespace) -> int:
+    _, solution = read(args.problem, args.solution, args.cache_dir)
+    print(solution.cost())
+    return 0
+
+
+def cmd_convert(args: argparse.Namespace) -> int:
+    from convert import convert_excel
+
+    if args.output is None and args.binary is None:
+        print("nothing to do, give --output and/or --binary", file=sys.stderr)
+        return 2
+    convert_excel(args.excel, args.output, args.binary)
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import json
+    import benchmark
+
+    results = benchmark.run(args.sizes, args.seed, not args.no_memory)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print("\n".join(benchmark.compare(json.load(f), results)))
+    return 0
+
+
+def cmd_batch(args: argparse.Namespace) -> int:
+    from batch import run_batch
+
+    summary = run_batch(args.problems, args.output, args.workers, args.timeout, time_limit=args.time_limit)
+    print(summary.drop(columns=["solution", "error"]).to_string(index=False))
+    return 0 if summary["error"].isna().all() else 1
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    solve = commands.add_parser("solve", help="solve a problem with the greedy algorithm")
+    solve.add_argument("problem", help="problem csv file")
+    solve.add_argument("-o", "--output", help="file to write the solution to (csv)")
+    solve.add_argument("--workers", type=int, default=1, help="number of processes that evaluate combinations")
+    solve.add_argument("--time-limit", type=float, help="time limit of the search in seconds")
+    solve.add_argument("--interval-budget", type=float, help="time limit of the search of each interval in seconds")
+    solve.add_argument("--max-clusters", type=int, default=4, help="maximum number of clusters per metal")
+    solve.add_argument("--search", default="exhaustive", choices=["exhaustive", "descent", "beam"],
+                       help="search strategy over the numbers of clusters, see search_combinations")
+    solve.add_argument("--improve", type=float, default=0, help="seconds of local search after the greedy solve")
+    solve.add_argument("--metrics", help="file to write the timings and statistics to (JSON)")
+    solve.add_argument("-v", "--verbose", action="store_true", help="print the progress of the solver")
+    solve.set_defaults(run=cmd_solve)
+
+    for name, run, description in [("check", cmd_check, "check the feasibility of a solution"),
+                                   ("cost", cmd_cost, "compute the cost of a solution")]:
+        command = commands.add_parser(name, help=description)
+        command.add_argument("problem", help="problem csv file")
+        command.add_argument("solution", help="solution csv file")
+        command.set_defaults(run=run)
+
+    for command in (solve, commands.choices["check"], commands.choices["cost"]):
+        command.add_argument("--cache-dir", help="directory in which parsed problems are cached (see read_problem)")
+
+    convert = commands.add_parser("convert", help="convert an Excel workbook of the case into our format")
+    convert.add_argument("excel", help="Excel file with the sheets Steps and Runs")
+    convert.add_argument("-o", "--output", help="csv file to write the problem to")
+    convert.add_argument("--binary", help="directory to write the problem to in binary format")
+    convert.set_defaults(run=cmd_convert)
+
+    batch = commands.add_parser("batch", help="solve many problem files in parallel (see batch.py)")
+    batch.add_argument("problems", help="directory with problem csv files, or a glob pattern")
+    batch.add_argument("--output", default="data/output/batch", help="directory to write the solutions to")
+    batch.add_argument("--workers", type=int, help="number of processes (default: one per CPU)")
+    batch.add_argument("--time-limit", type=float, help="time limit of the search of each instance in seconds")
+    batch.add_argument("--timeout", type=float, help="kill the process of an instance after this many seconds")
+    batch.set_defaults(run=cmd_batch)
+
+    bench = commands.add_parser("bench", help="benchmark the pipeline on random instances (see benchmark.py)")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="numbers of runs")
+    bench.add_argument("--seed", type=int, default=0, help="seed for the instance generator")
+    bench.add_argument("--no-memory", action="store_true", help="do not measure peak memory (faster)")
+    bench.add_argument("--output", default="bench_output.json", help="file to write the results to")
+    bench.add_argument("--compare", help="earlier results to compare with")
+    bench.set_defaults(run=cmd_bench)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,252 @@
+from operator import itemgetter
 from random import random
-from typing import List
+from typing import Callable, List
 import random
-from sklearn.cluster import KMeans
-from sklearn.exceptions import ConvergenceWarning
-from sklearn.utils._testing import ignore_warnings
+import warnings
 
 from data_structures import *
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas
 
 
-@ignore_warnings(category=ConvergenceWarning)
-def cluster_steps_by_length(steps: List[Step], k: int) -> List[List[Step]]:
+def kmeans_labels(lengths: np.ndarray, ks: List[int]) -> List[np.ndarray]:
+    """
+    Clustering backend that fits sklearn's (one dimensional) KMeans once for every k in `ks`. The result depends on the
+    random initialization of KMeans. sklearn is only imported when this backend is used.
+
+    Args:
+        lengths: 1-D array of step lengths
+        ks: the numbers of clusters to compute a clustering for
+
+    Returns: for each k in `ks`, an array with for each length the label of its cluster (between 0 and k-1)
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.exceptions import ConvergenceWarning
+
+    result = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=ConvergenceWarning)
+        for k in ks:
+            if len(lengths) <= k:
+                # every step in its own cluster
+                result.append(np.arange(len(lengths)))
+                continue
+            kmeans = KMeans(n_clusters=k, n_init="auto")
+            kmeans.fit(lengths.reshape(-1, 1))
+            result.append(kmeans.labels_)
+    return result
+
+
+def exact_labels(lengths: np.ndarray, ks: List[int]) -> List[np.ndarray]:
+    """
+    Clustering backend that computes an optimal (one dimensional) k-means clustering, i.e., one that minimizes the sum
+    of squared distances to the cluster means, for every k in `ks`. It is deterministic and uses only NumPy.
+
+    In one dimension, an optimal clustering consists of contiguous segments of the sorted lengths. So with prefix sums
+    the cost of any segment is found in O(1), and the optimal segmentation into k parts follows from the dynamic program
+        D[k][j] = min_{i < j} D[k-1][i] + cost(i, j)
+    where D[k][j] is the minimal cost of clustering the j smallest lengths into k clusters. The optimal `i` is monotone
+    in `j`, so each layer is computed by divide and conquer in O(n log n); all recursive calls on one level of the
+    recursion are evaluated at once with NumPy. A single pass over the layers gives the clusterings for all k.
+
+    Args:
+        lengths: 1-D array of step lengths
+        ks: the numbers of clusters to compute a clustering for
+
+    Returns: for each k in `ks`, an array with for each length the label of its cluster (between 0 and k-1). Labels
+        are sorted by length, i.e., cluster 0 contains the shortest steps. If there are fewer than k lengths, some
+        clusters are empty.
+    """
+    n = len(lengths)
+    if n == 0 or len(ks) == 0:
+        return [np.zeros(0, dtype=int) for _ in ks]
+
+    order = np.argsort(lengths, kind="stable")
+    x = lengths[order].astype(float)
+    x -= x.mean()  # centering keeps the prefix sums small, which improves precision
+    p1 = np.concatenate([[0.0], np.cumsum(x)])
+    p2 = np.concatenate([[0.0], np.cumsum(x * x)])
+
+    def cost(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """Sum of squared distances to the mean of the sorted lengths `x[i:j]` (for `i < j`)."""
+        s = p1[j] - p1[i]
+        return np.maximum(0.0, (p2[j] - p2[i]) - s * s / (j - i))
+
+    k_max = min(max(ks), n)
+
+    # layer k of `back` gives for each j the start of the last cluster in an optimal clustering of x[:j]
+    back = np.zeros((k_max + 1, n + 1), dtype=int)
+    previous = np.full(n + 1, np.inf)
+    previous[0] = 0.0
+    for k in range(1, k_max + 1):
+        current = np.full(n + 1, np.inf)
+
+        # each segment (j_lo, j_hi, o_lo, o_hi) asks for the optimum of all j in [j_lo, j_hi], knowing that the start
+        # of the last cluster lies in [o_lo, o_hi]
+        j_lo = np.array([k]); j_hi = np.array([n])
+        o_lo = np.array([k - 1]); o_hi = np.array([n - 1])
+        while len(j_lo) > 0:
+            mid = (j_lo + j_hi) // 2
+            hi = np.minimum(mid - 1, o_hi)
+            counts = hi - o_lo + 1
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+            # evaluate all candidates of all segments in one go
+            segment = np.repeat(np.arange(len(mid)), counts)
+            i = o_lo[segment] + np.arange(len(segment)) - offsets[segment]
+            j = mid[segment]
+            values = previous[i] + cost(i, j)
+
+            # take the first minimum of each segment
+            minima = np.minimum.reduceat(values, offsets)
+            positions = np.flatnonzero(values == minima[segment])
+            _, first = np.unique(segment[positions], return_index=True)
+            best = i[positions[first]]
+
+            current[mid] = minima
+            back[k, mid] = best
+
+            # split each segment around its midpoint
+            left = j_lo <= mid - 1
+            right = mid + 1 <= j_hi
+            j_lo, j_hi, o_lo, o_hi = (
+                np.concatenate([j_lo[left], (mid + 1)[right]]),
+                np.concatenate([(mid - 1)[left], j_hi[right]]),
+                np.concatenate([o_lo[left], best[right]]),
+                np.concatenate([best[left], o_hi[right]]),
+            )
+        previous = current
+
+    result = []
+    for k in ks:
+        k_used = min(k, n)
+        sorted_labels = np.empty(n, dtype=int)
+        j = n
+        for c in range(k_used, 0, -1):
+            i = back[c, j]
+            sorted_labels[i:j] = c - 1
+            j = i
+        labels = np.empty(n, dtype=int)
+        labels[order] = sorted_labels
+        result.append(labels)
+    return result
+
+
+# available clustering backends, see `kmeans_labels` and `exact_labels`
+CLUSTERING_BACKENDS: dict[str, Callable[[np.ndarray, List[int]], List[np.ndarray]]] = {
+    "exact": exact_labels,
+    "kmeans": kmeans_labels,
+}
+
+
+def cluster_steps_by_length_multi(steps: List[Step], ks: List[int], backend: str = "exact") -> List[List[List[Step]]]:
+    """
+    Same as `cluster_steps_by_length`, but computes a clustering for each k in `ks` with a single call to the backend.
+
+    Returns: for each k in `ks`, a List of k clusters (each cluster being a List of Steps)
+    """
+    assert all(k >= 1 for k in ks), "k must be at least 1"
+    lengths = np.array([step.length for step in steps], dtype=float)
+    result = []
+    for k, labels in zip(ks, CLUSTERING_BACKENDS[backend](lengths, list(ks))):
+        clusters = [[] for i in range(k)]
+        for i_step, label in enumerate(labels):
+            clusters[label].append(steps[i_step])
+        result.append(clusters)
+    return result
+
+
+def cluster_steps_by_length(steps: List[Step], k: int, backend: str = "exact") -> List[List[Step]]:
     """ Given a List of Steps, partition into k clusters based on length (step.length)
-    Uses (one dimensional) KMeans clustering algorithm to find the clusters
+    By default, an optimal one dimensional k-means clustering is computed exactly (see `exact_labels`). Alternatively,
+    the iterative KMeans algorithm of sklearn can be used by setting `backend` to "kmeans".
 
     Args:
         steps: List of steps
         k: number of clusters
+        backend: name of the clustering backend, i.e., a key of CLUSTERING_BACKENDS
 
     Returns: List of k clusters (each cluster being a List of Steps). No particular cluster order is guaranteed, nor is the order of Steps within any cluster.
 
     """
-    assert k >= 1, "k must be at least 1"
-    lengths = np.array([step.length for step in steps])
-    kmeans = KMeans(n_clusters=k, n_init="auto")
-    kmeans.fit(lengths.reshape(-1, 1))
-    labels = kmeans.labels_
-    clusters = [[] for i in range(k)]
-    for i_step, label in enumerate(labels):
-        clusters[label].append(steps[i_step])
-    return clusters
-
-
-def cluster_step_classes_by_length_then_sort(classes: List[List[Step]], number_of_clusters: List[int]) -> List[List[Step]]:
+    return cluster_steps_by_length_multi(steps, [k], backend)[0]
+
+
+class ClusterCache:
+    """
+    Memoizes the result of `cluster_steps_by_length`. The clustering of a set of steps into k clusters does not depend
+    on the clusters of other classes, so when many combinations of cluster counts are tried (as in `solve_interval`),
+    each (steps, k) pair only has to be fitted once. On a miss, the clusterings for all k up to `k_max` are computed
+    with a single call to the backend, which is much cheaper than separate fits for the exact backend.
+
+    Attributes:
+        k_max: int
+            On a miss, clusterings for all k between 1 and `k_max` are computed at once
+        backend: str
+            Name of the clustering backend, see CLUSTERING_BACKENDS
+        hits: int
+            Number of lookups that were answered from the cache
+        misses: int
+            Number of lookups that required a new fit
+    """
+
+    def __init__(self, k_max: int = 1, backend: str = "exact"):
+        self._clusters: dict[tuple[tuple[int, ...], int], List[List[Step]]] = {}
+        self._sorted: dict[tuple[tuple[int, ...], int], List[tuple[float, np.ndarray]]] = {}
+        self.k_max: int = k_max
+        self.backend: str = backend
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _lookup(self, indices: tuple[int, ...], steps: List[Step], k: int) -> List[List[Step]]:
+        # returns the clustering of `steps` (with step indices `indices`) into `k` clusters, fitting it on a miss
+        clusters = self._clusters.get((indices, k))
+        if clusters is None:
+            self.misses += 1
+            ks = list(range(1, max(k, self.k_max) + 1))
+            for k_fit, clusters_fit in zip(ks, cluster_steps_by_length_multi(steps, ks, self.backend)):
+                self._clusters.setdefault((indices, k_fit), clusters_fit)
+            clusters = self._clusters[(indices, k)]
+        else:
+            self.hits += 1
+        return clusters
+
+    def get(self, steps: List[Step], k: int) -> List[List[Step]]:
+        """
+        Returns the clustering of `steps` into `k` clusters, fitting it only if this pair was not seen before. The
+        returned clusters are fresh lists, so callers may sort them in place.
+        """
+        return [c.copy() for c in self._lookup(tuple(s.index for s in steps), steps, k)]
+
+    def get_sorted(self, steps: List[Step], k: int) -> List[tuple[float, np.ndarray]]:
+        """
+        Returns the non-empty clusters of the clustering of `steps` into `k` clusters, each as its mean step length and
+        the indices of its steps sorted by ascending length (see `cluster_step_classes_by_length_then_sort`). The
+        sorting is also done only once for each pair. The returned arrays must not be modified.
+        """
+        indices = tuple(s.index for s in steps)
+        result = self._sorted.get((indices, k))
+        if result is not None:
+            self.hits += 1
+        else:
+            clusters = self._lookup(indices, steps, k)
+            result = []
+            for cluster in clusters:
+                if len(cluster) == 0:
+                    continue
+                cluster_indices = np.array([s.index for s in cluster], dtype=np.int64)
+                lengths = steps[0].problem.step_length[cluster_indices]
+                order = np.argsort(lengths, kind="stable")
+                result.append((int(lengths.sum()) / len(cluster), cluster_indices[order]))
+            self._sorted[(indices, k)] = result
+        return result
+
+    def set_sorted(self, steps: List[Step], k: int, clusters: List[tuple[float, np.ndarray]]) -> None:
+        """Stores `clusters` as the result of `get_sorted(steps, k)`, e.g., when it was computed in another process."""
+        self._sorted[(tuple(s.index for s in steps), k)] = clusters
+
+
+def cluster_step_classes_by_length_then_sort(classes: List[List[Step]], number_of_clusters: List[int],
+                                             cache: ClusterCache | None = None) -> List[List[Step]]:
     """
     For each class of steps, say the i-th class, cluster into number_of_clusters[i] clusters based on step length
     Sort each cluster by ascending step length (so in each clusters the shorter steps go first)
@@ -43,6 +255,7 @@ def cluster_step_classes_by_length_then_sort(classes: List[List[Step]], number_o
     Args:
         classes: List of Classes (each being a List of Steps)
         number_of_clusters: a List of integers specifying the number of clusters for class 1,2,3,... respectively
+        cache: optionally, a ClusterCache that is used to reuse clusterings of earlier calls
 
     Returns: List of clusters (each being a list of steps), where the clusters are of ascending mean step length, and each cluster has steps of ascending length
 
@@ -52,7 +265,10 @@ def cluster_step_classes_by_length_then_sort(classes: List[List[Step]], number_o
     # putting them all in one pile
     clusters = []
     for step_class, k in zip(classes, number_of_clusters):
-        clusters.extend(cluster_steps_by_length(step_class, k))
+        if cache is None:
+            clusters.extend(cluster_steps_by_length(step_class, k))
+        else:
+            clusters.extend(cache.get(step_class, k))
 
     clusters = [c for c in clusters if len(c) > 0]
 
@@ -68,6 +284,24 @@ def cluster_step_classes_by_length_then_sort(classes: List[List[Step]], number_o
 
     return clusters_sorted
 
+
+def sorted_cluster_indices(classes: List[List[Step]], number_of_clusters: List[int], cache: ClusterCache) \
+        -> np.ndarray:
+    """
+    Same as `cluster_step_classes_by_length_then_sort`, but returns the indices of the steps of the concatenated
+    clusters as an array. The sorted clusters are taken from `cache`, so only the clusters themselves are sorted by
+    mean step length here.
+    """
+    clusters = []
+    for step_class, k in zip(classes, number_of_clusters):
+        clusters.extend(cache.get_sorted(step_class, k))
+    clusters.sort(key=itemgetter(0))
+    if len(clusters) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([indices for _, indices in clusters])
+
+#
+# import matplotlib.pyplot as plt
 #
 # n_classes = 3
 # classes = []
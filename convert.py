@@ -0,0 +1,80 @@
+"""
+Converts a problem in the format of the case (an Excel workbook with a sheet of steps and a sheet of runs) into our
+own format: a csv file with one row per run (see `read_problem`), or the binary format of `save_problem`.
+"""
+
+from data_structures import *
+
+
+def read_sheet(filename: str, sheet_name: str) -> pd.DataFrame:
+    """
+    Reads the sheet `sheet_name` of the Excel file `filename` into a dataframe, where the first row contains the column
+    names. The workbook is opened in read-only mode, so rows are streamed instead of loading the whole workbook.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows)
+        return pd.DataFrame([r for r in rows if any(v is not None for v in r)], columns=header)
+    finally:
+        workbook.close()
+
+
+def metal_codes(metal_types) -> dict:
+    """Assigns the codes 0, 1, 2, ... to the metal types, in increasing order (for example 304: 0, 316: 1, 430: 2)."""
+    return {metal: code for code, metal in enumerate(sorted(set(metal_types)))}
+
+
+def convert(df_steps: pd.DataFrame, df_runs: pd.DataFrame, metals: dict | None = None) -> pd.DataFrame:
+    """
+    Combines the steps and runs of a problem into one dataframe in our csv format, with columns step1, len1, step2,
+    len2, step3, len3, metal and due. The steps are joined to the runs on their StepId.
+
+    Args:
+        df_steps: the steps, with (at least) the columns StepId, MetalType and Length_Seconds
+        df_runs: the runs, with (at least) the columns Step1, Step2, Step3 and DueDate_Seconds
+        metals: the code of each metal type, by default assigned by `metal_codes`
+
+    Returns: the combined dataframe, with one row per run (in the order of `df_runs`)
+    """
+    if metals is None:
+        metals = metal_codes(df_steps["MetalType"])
+
+    steps = df_steps.set_index("StepId")[["MetalType", "Length_Seconds"]]
+    if not steps.index.is_unique:
+        raise ValueError("the StepIds of the steps are not unique")
+
+    df = pd.DataFrame(index=df_runs.index)
+    run_metals = []
+    for i in range(1, 4):
+        step = df_runs[f"Step{i}"]
+        joined = steps.reindex(step)
+        missing = joined["Length_Seconds"].isna().to_numpy()
+        if missing.any():
+            raise ValueError(f"unknown step {step[missing].iloc[0]}")
+        df[f"step{i}"] = step.to_numpy()
+        df[f"len{i}"] = joined["Length_Seconds"].to_numpy(dtype=np.int64)
+        run_metals.append(joined["MetalType"].to_numpy())
+
+    if not ((run_metals[0] == run_metals[1]) & (run_metals[0] == run_metals[2])).all():
+        raise ValueError("the steps of a run must have the same metal type")
+    df["metal"] = pd.Series(run_metals[0], index=df.index).map(metals).to_numpy(dtype=np.int64)
+    df["due"] = df_runs["DueDate_Seconds"].to_numpy(dtype=np.int64)
+
+    return df.reset_index(drop=True)
+
+
+def convert_excel(excel_file: str, csv_file: str | None = None, binary_dir: str | None = None,
+                  metals: dict | None = None) -> pd.DataFrame:
+    """
+    Converts the sheets Steps and Runs of `excel_file` (see `convert`), and writes the result to `csv_file` and/or, in
+    binary format (see `save_problem`), to `binary_dir`. Returns the combined dataframe.
+    """
+    df = convert(read_sheet(excel_file, "Steps"), read_sheet(excel_file, "Runs"), metals)
+    if csv_file is not None:
+        df.to_csv(csv_file, index=False)
+    if binary_dir is not None:
+        save_problem(problem_from_dataframe(df), binary_dir)
+    return df
@@ -6,76 +6,118 @@ Created on Tue Nov  7 13:59:55 2023
 """
 import pandas as pd
 import numpy as np
-import random
 
-def test_deadlines(data: pd.DataFrame, deadlines: [int]):
+# mean length of the last step of a run, for each metal (row) and peak (column)
+MEANS = [[2500, 16000, 30000],
+         [3500, 8000, 12000],
+         [14000, 18000, 25000]]
+
+
+def test_deadlines(numberDeadlines: int, rng: np.random.Generator) -> np.ndarray:
     """
-    Assigns new possible deadlines for test data. Deadlines will be assigned
-    to 12:00:00 starting from day 0
+    Chooses the possible deadlines for test data. Deadlines are at midnight of distinct days, the first one at
+    the start of day 3 (production starts just before midnight of the second day).
 
     Parameters
     ----------
-        data : Metal scheduling data.
-        deadlines : New deadlines (days).
-    
+        numberDeadlines : Number of deadlines.
+        rng : Random number generator.
+
     Returns
     -------
-        test : Test data with new deadlines.
+        deadlines : The deadlines in seconds, sorted.
 
     """
-    new_deadlines_sec = [None] * len(deadlines)
-    for i, j in enumerate(deadlines):  # make a list of the new deadlines relative to the starting time in seconds
-        new_deadlines_sec[i] = new_deadlines_sec[i] = 259200 + j*24*3600 #first deadline at midnight of the 3rd day (production start just before midnight of the second day)
-
-    k, m = divmod(len(data), len(new_deadlines_sec))  # determine the number of segments
-
-    test = data.copy()
-
-    # assign the new deadlines
-    for l in range(len(test['due'])):
-        test.loc[l,'due'] = random.choice(new_deadlines_sec)
-
-    return test
-
-def generate(numberRuns: int, numberPeaks: [int], numberDeadlines: int):
-    means = [[2500, 16000, 30000],
-             [3500, 8000, 12000],
-             [14000, 18000, 25000]]
-
-    numberPeaksTotal = sum(numberPeaks)
-
-    num_machines = 3
+    days = rng.permutation(max(7, numberDeadlines))[:numberDeadlines]
+    return np.sort(259200 + days * 24 * 3600)
 
-    # generate deadlines
-    d = list(range(7))
-    random.shuffle(d)
-    deadlines = d[:numberDeadlines]
 
-    lijsten = []
-    for i,ms in enumerate(means):
-        lengths = np.concatenate([
-                np.random.normal(m, 100, size=numberRuns // numberPeaksTotal) for m in ms])
-        metallist = np.full(numberRuns*3 // numberPeaksTotal, i)
-        lijsten.append(list(zip(lengths, metallist)))
-
-    rows = []
-    for i, (len3, metal) in enumerate(np.concatenate(lijsten)):
-        len3 = max(1,int(len3))
-        rows.append([
-            "A" + str(i),
-            max(0,len3-2),
-            "B" + str(i),
-            max(0,len3-1),
-            "C" + str(i),
-            len3,
-            int(metal),
-            0
-        ])
+def peak_means(numberPeaks: [int], rng: np.random.Generator) -> list[list[float]]:
+    """
+    Returns for each metal the mean length of each peak. These are taken from MEANS where possible, and drawn
+    uniformly from [2000, 30000] otherwise.
+    """
+    means = []
+    for i, peaks in enumerate(numberPeaks):
+        ms = list(MEANS[i][:peaks]) if i < len(MEANS) else []
+        ms += list(rng.uniform(2000, 30000, size=peaks - len(ms)))
+        means.append(ms)
+    return means
+
+
+def generate(numberRuns: int, numberPeaks: [int] = (3, 3, 3), numberDeadlines: int = 3,
+             filename: str | None = "./data/input/random_data.csv", seed: int | None = None,
+             numberMachines: int = 3, std: float = 100, sortByDue: bool = False,
+             chunksize: int | None = None) -> pd.DataFrame | None:
+    """
+    Generates a random problem instance. Metal i has numberPeaks[i] peaks, and every peak gets
+    numberRuns // sum(numberPeaks) runs, whose last step has a length drawn from a normal distribution around
+    the mean of the peak (see `peak_means`). The step on machine p is (numberMachines - 1 - p) seconds shorter
+    than the last step. Every run gets one of the deadlines (see `test_deadlines`) uniformly at random.
 
-    df = pd.DataFrame(rows, columns=["step1", "len1", "step2", "len2", "step3", "len3", "metal", "due"])
-    df = test_deadlines(df, deadlines)
+    All columns are generated as whole arrays with a NumPy Generator, so the same seed gives the same instance.
+    With `chunksize`, the instance is generated and written to `filename` in chunks of that many rows, which
+    keeps memory bounded for very large instances (the result does not depend on `chunksize`).
 
-    df.to_csv("./data/input/random_data.csv", index=False)
+    Parameters
+    ----------
+        numberRuns : (Approximate) number of runs.
+        numberPeaks : Number of peaks for each metal, so this also determines the number of metals.
+        numberDeadlines : Number of distinct deadlines.
+        filename : File to write the instance to (as csv), or None.
+        seed : Seed of the random number generator.
+        numberMachines : Number of machines (steps per run).
+        std : Standard deviation of the lengths within a peak.
+        sortByDue : Whether to sort the runs by due date (not possible with `chunksize`).
+        chunksize : If given, number of rows that are generated and written at once.
 
+    Returns
+    -------
+        df : The instance, or None if it was written in chunks.
 
-generate(90, [3,3,3], 3)
+    """
+    seeds = np.random.SeedSequence(seed).spawn(3)
+    rng_setup, rng_lengths, rng_due = [np.random.default_rng(s) for s in seeds]
+
+    deadlines = test_deadlines(numberDeadlines, rng_setup)
+    means = peak_means(list(numberPeaks), rng_setup)
+
+    # runs are generated peak by peak, and the peaks metal by metal
+    runsPerPeak = numberRuns // sum(numberPeaks)
+    peakMean = np.array([m for ms in means for m in ms])
+    peakMetal = np.repeat(np.arange(len(numberPeaks)), numberPeaks)
+    total = runsPerPeak * len(peakMean)
+
+    columns = [c for p in range(numberMachines) for c in (f"step{p+1}", f"len{p+1}")] + ["metal", "due"]
+
+    def rows(lo: int, hi: int) -> pd.DataFrame:
+        index = np.arange(lo, hi)
+        peak = index // runsPerPeak
+        last = np.maximum(1, rng_lengths.normal(peakMean[peak], std).astype(np.int64))
+        data = {}
+        for p in range(numberMachines):
+            data[f"step{p+1}"] = np.char.add(chr(65 + p), index.astype(str))
+            data[f"len{p+1}"] = np.maximum(0, last - (numberMachines - 1 - p))
+        data["metal"] = peakMetal[peak]
+        # (drawn from doubles, so the result does not depend on how the rows are split into chunks)
+        data["due"] = deadlines[(rng_due.random(hi - lo) * len(deadlines)).astype(np.int64)]
+        return pd.DataFrame(data, columns=columns)
+
+    if chunksize is None:
+        df = rows(0, total)
+        if sortByDue:
+            df = df.sort_values(by="due", kind="stable").reset_index(drop=True)
+        if filename is not None:
+            df.to_csv(filename, index=False)
+        return df
+
+    assert filename is not None, "a filename is required to write in chunks"
+    assert not sortByDue, "sorting by due date is not possible when writing in chunks"
+    with open(filename, "w", newline="") as f:
+        for lo in range(0, max(total, 1), chunksize):
+            rows(lo, min(total, lo + chunksize)).to_csv(f, index=False, header=(lo == 0))
+    return None
+
+
+if __name__ == "__main__":
+    generate(90, [3,3,3], 3)
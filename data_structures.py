@@ -1,12 +1,20 @@
 from operator import itemgetter
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 
 
 class Step:
     """
-    A class representing a step in the process
+    A class representing a step in the process. It is a lightweight view on the arrays of a Problem.
 
     Attributes:
+        problem: Problem
+            The problem instance this step belongs to
         index: int
             A unique index for each step
         name: str
@@ -17,22 +25,32 @@ class Step:
             Gives the run in which the step appears
     """
 
-    def __init__(self, index: int, name: str, length: int):
+    __slots__ = ("problem", "index", "length", "run")
+
+    def __init__(self, problem: "Problem", index: int, length: int, run: "Run"):
+        self.problem: Problem = problem
         self.index: int = index
-        self.name: str = name
-        self.length: int = length           # in seconds
-        self.run: Run = None                # will be initialized later
+        self.length: int = length       # in seconds
+        self.run: Run = run
+
+    @property
+    def name(self) -> str:
+        return str(self.problem.step_name[self.index])
 
     def phase(self) -> int:
         """Returns the machine that this step is performed on. For example, the step C023 has phase 2."""
-        return ord(self.name[0]) - 65
+        return int(self.problem.step_phase[self.index])
 
 
 class Run:
     """
-    A class representing a run in the process
+    A class representing a run in the process. It is a lightweight view on the arrays of a Problem.
 
     Attributes:
+        problem: Problem
+            The problem instance this run belongs to
+        index: int
+            A unique index for each run, runs are sorted by due date
         metal: int
             Gives the metal type of the run
         steps: list[step]
@@ -41,17 +59,45 @@ class Run:
             Gives the due date of the run in seconds
     """
 
-    def __init__(self, metal: int, steps: list[Step], due: int):
-        self.metal: int = metal             # metal type
-        self.steps: list[Step] = steps
-        self.due: int = due                 # due date in seconds
+    __slots__ = ("problem", "index", "metal", "due", "_steps")
+
+    def __init__(self, problem: "Problem", index: int, metal: int, due: int):
+        self.problem: Problem = problem
+        self.index: int = index
+        self.metal: int = metal         # metal type
+        self.due: int = due             # due date in seconds
+        self._steps: list[Step] | None = None
+
+    @property
+    def steps(self) -> list[Step]:
+        if self._steps is None:
+            steps = self.problem.steps
+            self._steps = [steps[i] for i in self.problem.run_steps[self.index].tolist()]
+        return self._steps
 
 
 class Problem:
     """
-    A class representing a problem instance.
+    A class representing a problem instance. The data is stored in (contiguous) NumPy arrays, indexed by step index or
+    run index. The Step and Run objects are views on these arrays, which are only created when they are accessed.
+    Indexing a NumPy array for a single value is slow, so the lengths, metals and due dates are copied into the views
+    (as Python ints) when they are created. Creating the steps also creates the runs.
 
     Attributes:
+        step_name: np.ndarray
+            For each step, its name as provided in the data. Steps are sorted by name
+        step_length: np.ndarray
+            For each step, the time it takes on its machine (in seconds)
+        step_phase: np.ndarray
+            For each step, the machine that it is performed on
+        step_run: np.ndarray
+            For each step, the index of the run in which it appears
+        run_metal: np.ndarray
+            For each run, its metal type
+        run_due: np.ndarray
+            For each run, its due date in seconds. Runs are sorted by due date
+        run_steps: np.ndarray
+            For each run, the indices of its three steps (one row per run)
         step_indices: dict[str, int]
             A data structure to find a step's index given its name
         steps: list[Step]
@@ -60,48 +106,157 @@ class Problem:
             A collection of all runs
     """
 
-    def __init__(self):
-        self.step_indices: dict[str, int] = {}
-        self.steps: list[Step] = []
-        self.runs: list[Run] = []
+    def __init__(self,
+                 step_name: np.ndarray | None = None,
+                 step_length: np.ndarray | None = None,
+                 run_metal: np.ndarray | None = None,
+                 run_due: np.ndarray | None = None,
+                 run_steps: np.ndarray | None = None):
+        self.step_name: np.ndarray = np.zeros(0, dtype=str) if step_name is None else step_name
+        self.step_length: np.ndarray = np.zeros(0, dtype=np.int64) if step_length is None else step_length
+        self.run_metal: np.ndarray = np.zeros(0, dtype=np.int64) if run_metal is None else run_metal
+        self.run_due: np.ndarray = np.zeros(0, dtype=np.int64) if run_due is None else run_due
+        self.run_steps: np.ndarray = np.zeros((0, 3), dtype=np.int64) if run_steps is None else run_steps
+
+        # derived arrays
+        # the phase is given by the first letter of the name, e.g., step C023 has phase 2
+        self.step_phase: np.ndarray = \
+            np.frombuffer(self.step_name.astype("U1").tobytes(), dtype=np.uint32).astype(np.int8) - 65
+        self.step_run: np.ndarray = np.zeros(len(self.step_name), dtype=np.int64)
+        self.step_run[self.run_steps] = np.arange(len(self.run_steps))[:, None]
+
+        # views and lookup table, created lazily
+        self._step_indices: dict[str, int] | None = None
+
+    @property
+    def step_indices(self) -> dict[str, int]:
+        if self._step_indices is None:
+            self._step_indices = {name: i for i, name in enumerate(self.step_name.tolist())}
+        return self._step_indices
+
+    # (cached properties, so that after the first access they are plain attributes)
+    @functools.cached_property
+    def steps(self) -> list[Step]:
+        runs = self.runs
+        return [Step(self, i, length, runs[r]) for i, (length, r) in
+                enumerate(zip(self.step_length.tolist(), self.step_run.tolist()))]
+
+    @functools.cached_property
+    def runs(self) -> list[Run]:
+        return [Run(self, i, metal, due) for i, (metal, due) in
+                enumerate(zip(self.run_metal.tolist(), self.run_due.tolist()))]
 
     def get_step(self, name) -> Step:
         """Returns the step object given its name."""
         return self.steps[self.step_indices[name]]
 
 
-def read_problem(filename: str = "./data/input/data.csv") -> Problem:
+# the arrays that define a problem, see `save_problem` and `load_problem`
+PROBLEM_ARRAYS = ["step_name", "step_length", "run_metal", "run_due", "run_steps"]
+
+
+def save_problem(prob: Problem, directory: str) -> None:
+    """
+    Saves the arrays of `prob` in binary format, as one `.npy` file per array in `directory`. The directory is written
+    atomically: it is either complete or it does not exist.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        for name in PROBLEM_ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), getattr(prob, name))
+        os.replace(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+def load_problem(directory: str, mmap: bool = True) -> Problem:
+    """
+    Loads a problem that was saved by `save_problem`. By default the arrays are memory-mapped (read-only), so loading
+    takes almost no time and the data is only read from disk when it is used.
+    """
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode) for name in PROBLEM_ARRAYS}
+    return Problem(**arrays)
+
+
+def file_hash(filename: str) -> str:
+    """Returns the SHA-256 hash of the contents of the file `filename`."""
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# the columns of a problem csv file and their types
+PROBLEM_CSV_DTYPES = {
+    "step1": str, "step2": str, "step3": str,
+    "len1": np.int64, "len2": np.int64, "len3": np.int64,
+    "metal": np.int64, "due": np.int64,
+}
+
+
+def problem_from_dataframe(df: pd.DataFrame) -> Problem:
+    """
+    Creates a Problem object from a dataframe in our csv format (one row per run, see `read_problem`).
+    """
+
+    df = df.sort_values(by="due", kind="stable")  # runs are sorted by due date
+
+    # create steps, sorted by name
+    names = np.concatenate([df[c].to_numpy(dtype=str) for c in ["step1", "step2", "step3"]])
+    lengths = np.concatenate([df[c].to_numpy(dtype=np.int64) for c in ["len1", "len2", "len3"]])
+    order = np.argsort(names, kind="stable")
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[order] = np.arange(len(names))
+
+    # create runs, and link them to their steps (by index)
+    return Problem(
+        step_name=names[order],
+        step_length=lengths[order],
+        run_metal=df["metal"].to_numpy(dtype=np.int64),
+        run_due=df["due"].to_numpy(dtype=np.int64),
+        run_steps=rank.reshape(3, -1).T.copy(),
+    )
+
+
+def problem_to_dataframe(prob: Problem) -> pd.DataFrame:
+    """
+    Inverse of `problem_from_dataframe`: returns the runs of `prob` as a dataframe in our csv format (one row per run,
+    in the order of the runs).
+    """
+    df = pd.DataFrame(index=pd.RangeIndex(len(prob.run_due)))
+    for p in range(3):
+        steps = prob.run_steps[:, p]
+        df[f"step{p+1}"] = prob.step_name[steps]
+        df[f"len{p+1}"] = prob.step_length[steps]
+    df["metal"] = prob.run_metal
+    df["due"] = prob.run_due
+    return df
+
+
+def read_problem(filename: str = "./data/input/data.csv", cache_dir: str | None = None) -> Problem:
     """
     Reads a csv file given by `filename` and parses it into a Problem object.
+    If `cache_dir` is given, the parsed problem is saved there in binary format (see `save_problem`), keyed on the hash
+    of the contents of the file. Reading the same file again then loads (and memory-maps) the binary version instead of
+    parsing the csv file.
     """
 
-    df = pd.read_csv(filename)
-    prob = Problem()
-
-    # create steps
-    df_steps1 = df[["step1", "len1"]]; df_steps1.columns = ["step", "len"]
-    df_steps2 = df[["step2", "len2"]]; df_steps2.columns = ["step", "len"]
-    df_steps3 = df[["step3", "len3"]]; df_steps3.columns = ["step", "len"]
-    df_steps = pd.concat([df_steps1, df_steps2, df_steps3])
-    df_steps.sort_values(by="step", inplace=True)
-    df_steps.reset_index(drop=True, inplace=True)
-    for i, r in df_steps.iterrows():
-        step = Step(i, r["step"], r["len"])
-        prob.step_indices[step.name] = step.index
-        prob.steps.append(step)
-
-    # create runs
-    for _, r in df.iterrows():
-        run = Run(
-            r["metal"],
-            [prob.get_step(r["step1"]), prob.get_step(r["step2"]), prob.get_step(r["step3"])],
-            r["due"]
-        )
-        prob.runs.append(run)
-        # link steps to run as well
-        for s in run.steps:
-            s.run = run
-    prob.runs.sort(key=lambda x: x.due)
+    if cache_dir is not None:
+        cached = os.path.join(cache_dir, file_hash(filename))
+        if os.path.isdir(cached):
+            return load_problem(cached)
+
+    df = pd.read_csv(filename, dtype=PROBLEM_CSV_DTYPES)
+    prob = problem_from_dataframe(df)
+
+    if cache_dir is not None:
+        save_problem(prob, cached)
 
     return prob
 
@@ -118,7 +273,7 @@ class Solution:
     def __init__(self, problem: Problem | None = None):
         self.problem: Problem = problem
         # start time for each step, indexed by `step.index`
-        self.start: list[int | None] = [] if problem is None else [None] * len(problem.steps)
+        self.start: list[int | None] = [] if problem is None else [None] * len(problem.step_name)
 
     def get_end(self, run: Run) -> int | None:
         """Returns the time when `run` finishes, or `None` if it's not scheduled."""
@@ -149,19 +304,25 @@ class Solution:
         steps of `runs` are adjacent. Note that potential setup time before the first run is not considered.
         """
 
-        if runs is None: runs = self.problem.runs
-        assert all(r is not None for r in runs)
+        prob = self.problem
+        if runs is None:
+            index = np.arange(len(prob.run_due))
+        else:
+            assert all(r is not None for r in runs)
+            index = np.array([r.index for r in runs], dtype=np.int64)
 
-        # tuple runs with end time
+        # compute the end time of each run (the end of its last step)
         # then sort from first to last finished
-        runs = [(r, self.get_end(r)) for r in runs]
-        runs.sort(key=itemgetter(1))
+        steps_c = prob.run_steps[index, 2]
+        end = np.array([self.start[s] for s in steps_c.tolist()], dtype=np.int64) + prob.step_length[steps_c]
+        order = np.argsort(end, kind="stable")
 
         # compute lateness: sum "TooLate" for each run and rescale from seconds to weeks
-        lateness = sum(max(0, end - run.due) for run, end in runs) / (7 * 24 * 3600)
+        lateness = int(np.maximum(0, end - prob.run_due[index]).sum()) / (7 * 24 * 3600)
 
         # compute setup time: add one hour each time adjacent metals are different
-        setup_time = sum(r1.metal != r2.metal for (r1, _), (r2, _) in zip(runs, runs[1:]))
+        metals = prob.run_metal[index][order]
+        setup_time = int((metals[1:] != metals[:-1]).sum())
 
         return lateness + setup_time
 
@@ -176,31 +337,212 @@ class Solution:
         return c
 
 
-def parse_solution(prob: Problem, df_solution: pd.DataFrame | None = None) -> Solution:
+class Frontier:
+    """
+    A class representing the state at the end of a (partial) schedule, i.e., everything that is needed to extend the
+    schedule with more runs.
+
+    Attributes:
+        end: list[int]
+            For each machine (indexed by phase), the time at which its last scheduled step finishes
+        metal: int | None
+            The metal type of the last run on the slab caster, or `None` if nothing is scheduled yet
+    """
+
+    def __init__(self, end: list[int] | None = None, metal: int | None = None):
+        self.end: list[int] = [0, 0, 0] if end is None else end
+        self.metal: int | None = metal
+
+    def is_empty(self) -> bool:
+        """Returns whether this is the frontier of an empty schedule."""
+        return self.metal is None
+
+    def copy(self) -> "Frontier":
+        """Returns a copy of this frontier."""
+        return Frontier(self.end.copy(), self.metal)
+
+    @staticmethod
+    def from_solution(solution: "Solution") -> "Frontier":
+        """
+        Computes the frontier of `solution` by scanning all its start times. Prefer passing frontiers along (as
+        `solve` does) over calling this repeatedly.
+        """
+        frontier = Frontier()
+        for i, t in enumerate(solution.start):
+            if t is not None:
+                step = solution.problem.steps[i]
+                p = step.phase()
+                if t + step.length > frontier.end[p]:
+                    frontier.end[p] = t + step.length
+                    if p == 2:
+                        frontier.metal = step.run.metal
+        return frontier
+
+
+def read_excel_cached(filename: str, sheet_name: str, cache_dir: str | None = "./data/cache") -> pd.DataFrame:
+    """
+    Reads the sheet `sheet_name` of the Excel file `filename` into a dataframe. If `cache_dir` is given, the result is
+    also saved there (as a pickle, keyed on the hash of the contents of the file and the sheet name), so later calls
+    do not have to parse the Excel file again. Changing the Excel file invalidates the cache.
+    """
+    if cache_dir is None:
+        return pd.read_excel(filename, sheet_name=sheet_name)
+
+    cached = os.path.join(cache_dir, f"{file_hash(filename)}.{sheet_name}.pkl")
+    if os.path.isfile(cached):
+        return pd.read_pickle(cached)
+
+    df = pd.read_excel(filename, sheet_name=sheet_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir)
+    os.close(fd)
+    df.to_pickle(tmp)
+    os.replace(tmp, cached)  # atomic, so the cache is never read while it is incomplete
+    return df
+
+
+def find_steps(prob: Problem, names: np.ndarray) -> np.ndarray:
+    """
+    Returns the indices of the steps with the given `names`, looked up all at once (steps are sorted by name). Raises a
+    KeyError for the first name that is not a step of `prob`.
+    """
+    names = np.asarray(names, dtype=str)
+    indices = np.searchsorted(prob.step_name, names)
+    unknown = (indices >= len(prob.step_name)) | (prob.step_name[np.minimum(indices, len(prob.step_name) - 1)] != names)
+    if unknown.any():
+        raise KeyError(names[unknown][0])
+    return indices
+
+
+def parse_solution(prob: Problem, df_solution: pd.DataFrame | None = None,
+                   cache_dir: str | None = "./data/cache") -> Solution:
     """
     Given a problem and a dataframe containing the information of a solution, transforms it into an instance of the class Solution
 
     Input:
         prob: Problem instance
         df_solution: Dataframe containing a solution
+        cache_dir: directory in which the parsed example solution is cached when `df_solution` is not given (see
+            `read_excel_cached`), or `None` to always read the Excel file
     Output:
         sol: Object of class Solution
     """
     if df_solution is None:
         # by default read the example solution
-        df_solution = pd.read_excel("./data/input/TUEdatav1.xlsx", sheet_name="InitialSolution")
+        df_solution = read_excel_cached("./data/input/TUEdatav1.xlsx", "InitialSolution", cache_dir)
+
+    indices = find_steps(prob, df_solution["StepId"].to_numpy(dtype=str))
+
+    start = df_solution["StartDate_Seconds"] + df_solution["SetupTime_Hours"] * 3600
 
     sol = Solution(prob)
-    for _, r in df_solution.iterrows():
-        i = prob.step_indices[r["StepId"]]
-        sol.start[i] = r["StartDate_Seconds"] + r["SetupTime_Hours"] * 3600
+    if len(indices) == len(prob.step_name) and len(np.unique(indices)) == len(indices):
+        # every step is scheduled, so the start times can be assigned in one go
+        order = np.empty(len(indices), dtype=np.int64)
+        order[indices] = np.arange(len(indices))
+        sol.start = start.to_numpy()[order].tolist()
+    else:
+        for i, t in zip(indices.tolist(), start.tolist()):
+            sol.start[i] = t
 
     return sol
 
 
+def _violations(sol: Solution):
+    """
+    Generates the violations of the constraints of the problem by `sol`, one rule at a time. For each rule, yields a
+    tuple (rule, first, second, amount), where `first` and `second` are arrays of step indices (`second` is -1 if a
+    violation involves only one step) and `amount` is an array with the size of each violation in seconds. All checks
+    are vectorized; the overlap and setup checks sort the steps of each machine once, so this takes O(n log n) time.
+    """
+    prob = sol.problem
+    start = np.array(sol.start, dtype=float)  # unscheduled steps become NaN
+    end = start + prob.step_length
+    none = np.full(len(start), -1)
+
+    # every step must be scheduled
+    unscheduled = np.flatnonzero(np.isnan(start))
+    yield "unscheduled", unscheduled, none[unscheduled], np.zeros(len(unscheduled))
+
+    # start and end times must lie within [0, 2000000]
+    negative = np.flatnonzero(start < 0)
+    yield "negative_start", negative, none[negative], -start[negative]
+    out_of_bounds = np.flatnonzero(end > 2000000)
+    yield "out_of_bounds", out_of_bounds, none[out_of_bounds], end[out_of_bounds] - 2000000
+
+    # the steps of a run must be performed in order, and cannot overlap
+    for p in range(2):
+        first = prob.run_steps[:, p]
+        second = prob.run_steps[:, p+1]
+        amount = end[first] - start[second]
+        late = amount > 0
+        yield "precedence", first[late], second[late], amount[late]
+
+    # the slab caster is under maintenance until 172800
+    steps_c = prob.run_steps[:, 2]
+    amount = 172800 - end[steps_c]
+    early = amount > 0
+    yield "maintenance", steps_c[early], none[steps_c[early]], amount[early]
+
+    # each machine can perform one step at a time, and the slab caster needs one hour to switch metals
+    for p, machine in enumerate("ABC"):
+        steps = prob.run_steps[:, p]
+        steps = steps[np.argsort(start[steps], kind="stable")]
+        first, second = steps[:-1], steps[1:]
+        gap = start[second] - end[first]
+        overlap = gap < 0
+        yield f"overlap_{machine}", first[overlap], second[overlap], -gap[overlap]
+
+        if p == 2:
+            metal = prob.run_metal[prob.step_run]
+            no_setup = (metal[first] != metal[second]) & (gap >= 0) & (gap < 3600)
+            yield "setup", first[no_setup], second[no_setup], 3600 - gap[no_setup]
+
+
+def is_feasible(sol: Solution) -> bool:
+    """
+    Returns whether `sol` is feasible. This is the cheap version of `feasibility_report`: it does not build a report,
+    and it stops at the first rule that is violated.
+    """
+    return all(len(first) == 0 for _, first, _, _ in _violations(sol))
+
+
+def feasibility_report(sol: Solution) -> pd.DataFrame:
+    """
+    Checks all constraints of the problem for `sol` and returns every violation.
+
+    Args:
+        sol: object from class Solution
+
+    Returns:
+        pd.DataFrame: one row per violation, with columns
+            rule: name of the violated rule (unscheduled, negative_start, out_of_bounds, precedence, maintenance,
+                  overlap_A, overlap_B, overlap_C or setup)
+            StepId1: the (first) step involved
+            StepId2: the second step involved, for rules concerning two steps (and empty otherwise)
+            amount: size of the violation in seconds
+        The solution is feasible if and only if the result is empty.
+    """
+    names = sol.problem.step_name
+    parts = []
+    for rule, first, second, amount in _violations(sol):
+        if len(first) == 0:
+            continue
+        parts.append(pd.DataFrame({
+            "rule": rule,
+            "StepId1": names[first],
+            "StepId2": np.where(second >= 0, names[second], ""),
+            "amount": amount,
+        }))
+    if len(parts) == 0:
+        return pd.DataFrame(columns=["rule", "StepId1", "StepId2", "amount"])
+    return pd.concat(parts, ignore_index=True)
+
+
 def feasibility(sol: Solution) -> bool:
     """
-    For a given solution checks whether the solution is feasible
+    For a given solution checks whether the solution is feasible, and prints the number of violations of each rule if
+    it is not. Use `feasibility_report` to get all violations, or `is_feasible` to only get the answer.
 
     Args:
         sol: object from class Solution
@@ -208,138 +550,103 @@ def feasibility(sol: Solution) -> bool:
     Returns:
         bool: Returns True if the solution is feasible and False when it is not
     """
-    #Initialize lists
-    Astart = []
-    Bstart = []
-    Cstart = []
-    for run in sol.problem.runs:
-        #get steps of one run
-        step1 = run.steps[0]
-        step2 = run.steps[1]
-        step3 = run.steps[2]
-        #get length of the steps
-        len1 = step1.length
-        len2 = step2.length
-        len3 = step3.length
-        #get start time of steps from solution
-        start1 = sol.start[step1.index]
-        start2 = sol.start[step2.index]
-        start3 = sol.start[step3.index]
-        #get end times of the steps from the solutions
-        end1 = start1 + len1
-        end2 = start2 + len2
-        end3 = start3 + len3
-
-        if start1 > start2 or start2 > start3:
-            print('Infeasible, run goes to machines in wrong order')
-            return False
-
-        if start1 < 0 or start2 < 0 or start3 < 0:
-            print('Infeasible, negative start times')
-            return False
-
-        if end1 > 2000000 or end2 > 2000000 or end3 > 2000000:
-            print('Infeasible, end times out of bound')
-            return False
-
-        if start2 < end1 or start3 < end2:
-            print('Infeasible, overlapping end and start times for one run')
-            return False
-
-        if end3 < 172800:
-            print('Infeasible, Machine under maintenance')
-            return False
-        #Add steps on machine A,B and C to the respective lists
-        Astart.append([step1.index, sol.start[step1.index]])
-        Bstart.append([step2.index, sol.start[step2.index]])
-        Cstart.append([step3.index, sol.start[step3.index]])
-    #Sort lists by starting times
-    Astart = sorted(Astart, key=lambda x: x[1])
-    Bstart = sorted(Bstart, key=lambda x: x[1])
-    Cstart = sorted(Cstart, key=lambda x: x[1])
-    #Check for overlap on machine A
-    for i in range(len(Astart)-1):
-        start2 = Astart[i+1][1]
-        ind1 = Astart[i][0]
-        len1 = sol.problem.steps[ind1].length
-        end1 = Astart[i][1] + len1
-
-        if end1 > start2:
-            print('infeasible, overlap on machine A')
-            return False
-    #Check for overlap on machine B
-    for i in range(len(Bstart)-1):
-        start2 = Bstart[i+1][1]
-        ind1 = Bstart[i][0]
-        len1 = sol.problem.steps[ind1].length
-        end1 = Bstart[i][1] + len1
-
-        if end1 > start2:
-            print('infeasible, overlap on machine B')
-            return False
-    #Check for overlap on machine C as well as whether the setup times are correct
-    for i in range(len(Cstart)-1):
-        start2 = Cstart[i+1][1]
-        ind1 = Cstart[i][0]
-        ind2 = Cstart[i+1][0]
-        len1 = sol.problem.steps[ind1].length
-        end1 = Cstart[i][1] + len1
-
-        if end1 > start2:
-            print('infeasible, overlap on machine C')
-            return False
-
-        for run in sol.problem.runs:
-            if sol.problem.steps[ind1] in run.steps:
-                metal1 = run.metal
-            if sol.problem.steps[ind2] in run.steps:
-                metal2 = run.metal
-
-        if metal1 != metal2:
-            if end1 > start2 - 3600:
-                print('infeasible , no setup time')
-                return False
-    return True
-
-def write_solution(sol: Solution, filename: str) -> None:
+    report = feasibility_report(sol)
+    for rule, count in report["rule"].value_counts(sort=False).items():
+        print(f"Infeasible, {count} violation(s) of rule {rule}")
+    return len(report) == 0
+
+
+# the columns of a solution csv file
+SOLUTION_COLUMNS = ["StepId", "StartDate_Seconds", "EndDate_Seconds", "TooLate_Weeks", "SetupTime_Hours"]
+
+
+def solution_columns(sol: Solution, previous_metal: int | None = None, float_lateness: bool = False) \
+        -> dict[str, np.ndarray]:
+    """
+    Given an instance of the solution class, computes the columns of its csv file (see `write_solution`) as arrays.
+    The runs are sorted by time of finishing, and each run gives three rows (one per step). On the slab caster, the
+    setup time (if any) is included in the step, and a run is late if this step ends after its due date.
+
+    Input:
+        sol: Solution instance
+        previous_metal: metal on the slab caster before the first run of `sol` (if any), which determines whether the
+            first run needs a setup
+        float_lateness: whether TooLate_Weeks is always a float column; by default it contains integers if no run is
+            late, as in the csv files of the case
+    Output:
+        columns: for each name in SOLUTION_COLUMNS, an array with one value per step
+    """
+    prob = sol.problem
+    start = np.array(sol.start, dtype=np.int64)
+    step_c = prob.run_steps[:, 2]
+
+    # sort runs by time of finishing, and take their steps in order
+    order = np.argsort(start[step_c] + prob.step_length[step_c], kind="stable")
+    steps = prob.run_steps[order].ravel()
+    on_c = prob.step_phase[steps] == 2
+
+    # a setup is necessary on the slab caster if the metal differs from the one of the previous run
+    metal = prob.run_metal[order]
+    previous = np.empty_like(metal)
+    previous[1:] = metal[:-1]
+    if len(metal) > 0:
+        previous[0] = metal[0] if previous_metal is None else previous_metal
+    setup = np.repeat((metal != previous).astype(np.int64), 3) * on_c
+
+    step_start = start[steps] - 3600 * setup
+    step_end = start[steps] + prob.step_length[steps] + 3600 * setup
+    lateness = np.where(on_c, np.maximum(0, step_end - np.repeat(prob.run_due[order], 3)), 0)
+    too_late = lateness / 7 / 24 / 3600
+    if not float_lateness and not (lateness > 0).any():
+        too_late = np.zeros(len(steps), dtype=np.int64)  # the csv contains integers if no run is late
+
+    return {
+        "StepId": prob.step_name[steps],
+        "StartDate_Seconds": step_start,
+        "EndDate_Seconds": step_end,
+        "TooLate_Weeks": too_late,
+        "SetupTime_Hours": setup,
+    }
+
+
+def solution_to_dataframe(sol: Solution, previous_metal: int | None = None, float_lateness: bool = False) \
+        -> pd.DataFrame:
+    """
+    Given an instance of the solution class, returns the rows of its csv file (see `write_solution`) as a dataframe.
+    See `solution_columns` for the arguments.
+    """
+    columns = solution_columns(sol, previous_metal, float_lateness)
+    columns["StepId"] = columns["StepId"].astype(object)
+    return pd.DataFrame(columns, columns=SOLUTION_COLUMNS)
+
+
+def write_solution(sol: Solution, filename: str, chunksize: int = 100000, binary: bool = False) -> None:
     """
     Given an instance of the solution class and a filename transforms it into a cvs file
+    All columns are computed at once (see `solution_columns`), and then written in chunks of `chunksize` rows.
+    Alternatively, with `binary` the columns are written in binary (columnar) format to an `.npz` file, which can be
+    read back with `np.load`.
 
     Input:
         sol: Solution instance
         filename: name of the file
+        chunksize: number of rows that are converted to text at once
+        binary: whether to write an `.npz` file instead of a csv file
     Output:
         None
     """
-    prob = sol.problem
-    runs = sorted(prob.runs, key=lambda r: sol.get_end(r))  # list of runs sorted by time of finishing
-
-    result = []
-
-    for i, r in enumerate(runs):
-        for step in r.steps:
-            row = {}
-            row["StepId"] = step.name
-            row["StartDate_Seconds"] = sol.start[step.index]
-            endTime = sol.start[step.index] + step.length
-            row["EndDate_Seconds"] = endTime
-            row["TooLate_Weeks"] = 0
-            row["SetupTime_Hours"] = 0
-
-            if step.phase() == 2:
-                # step on machine C
-                previousRun = runs[max(0,i-1)]
-                if previousRun.metal != r.metal:
-                    # setup necessary
-                    row["StartDate_Seconds"] -= 3600
-                    endTime += 3600
-                    row["SetupTime_Hours"] = 1
-                row["EndDate_Seconds"] = endTime
-                lateness = max(0, endTime - r.due)
-                if lateness > 0:
-                    # run is late
-                    row["TooLate_Weeks"] = lateness / 7 / 24 / 3600
-
-            result.append(row)
-
-    pd.DataFrame(result).to_csv(filename)
+    columns = solution_columns(sol)
+    if binary:
+        np.savez(filename, **columns)
+        return
+
+    columns["StepId"] = columns["StepId"].astype(object)
+    n = len(columns["StepId"])
+    with open(filename, "w", newline="") as f:
+        for lo in range(0, max(n, 1), chunksize):
+            chunk = pd.DataFrame(
+                {name: values[lo:lo + chunksize] for name, values in columns.items()},
+                columns=SOLUTION_COLUMNS,
+                index=pd.RangeIndex(lo, min(n, lo + chunksize)),
+            )
+            chunk.to_csv(f, header=(lo == 0))
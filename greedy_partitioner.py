@@ -1,25 +1,31 @@
-from clustering import cluster_step_classes_by_length_then_sort
+from clustering import ClusterCache, sorted_cluster_indices
 from data_structures import *
+from metrics import Metrics
 from utils import *
+from typing import Callable, Iterator
 import math
+import multiprocessing
+import multiprocessing.pool
+from multiprocessing import resource_tracker, shared_memory
+import threading
+import time
+import numpy as np
+import pandas as pd
 
 
-def sequence_to_schedule(solution: Solution, sequence: list[Step]) -> Solution:
+def _time_sequence(sequence: list[Step], frontier: Frontier, start_times: list[int | None] | None = None) \
+        -> tuple[int, int, Frontier]:
     """
-    Extend an existing schedule `solution` with a sequence of steps for machine C. The schedules for machine A and B are
-    inferred from machine C. This function does not modify `solution`, but returns a copy with changes.
+    Computes the start times of the runs of `sequence` (a sequence of steps for machine C) when they are scheduled after
+    `frontier`. If `start_times` is given, the start times are written into it (indexed by `step.index`).
+    Returns the total lateness in seconds, the number of setups (including the one between `frontier` and the first
+    run), and the frontier after the sequence.
     """
 
-    assert all(s.phase() == 2 for s in sequence), "`sequence` must only consist of steps for the Slab Caster"
-    assert all_unique(s.index for s in sequence)
-    assert all(solution.start[s.index] is None for s in sequence)
+    start = frontier.end.copy()
+    previous_metal = frontier.metal
 
-    solution = solution.copy()
-
-    start = [0, 0, 0]
-    previous_metal = 0
-
-    if all(t is None for t in solution.start):
+    if frontier.is_empty():
         first_run = sequence[0].run
 
         step_a = first_run.steps[0]
@@ -31,32 +37,135 @@ def sequence_to_schedule(solution: Solution, sequence: list[Step]) -> Solution:
         start[2] = max(start[1] + step_b.length, 172800 - step_c.length)
 
         previous_metal = first_run.metal
-    else:
-        for i, t in enumerate(solution.start):
-            if t is not None:
-                step = solution.problem.steps[i]
-                p = step.phase()
-                if t + step.length > start[p]:
-                    start[p] = t + step.length
-                    if p == 2:
-                        previous_metal = step.run.metal
 
+    lateness = 0
+    setups = 0
     runs = [s.run for s in sequence]
     for run in runs:
         setup_time = 3600 if run.metal != previous_metal else 0
+        setups += run.metal != previous_metal
         previous_metal = run.metal
 
         for step in run.steps:
             p = step.phase()
 
-            solution.start[step.index] = max(start[p], start[max(0, p-1)])
-            start[p] = solution.start[step.index] + step.length
+            t = max(start[p], start[max(0, p-1)])
+            start[p] = t + step.length
 
             if p == 2:
-                solution.start[step.index] += setup_time
+                t += setup_time
                 start[p] += setup_time
+                lateness += max(0, start[p] - run.due)
 
-    return solution
+            if start_times is not None:
+                start_times[step.index] = t
+
+    return lateness, setups, Frontier(start, previous_metal)
+
+
+def evaluate_sequence(sequence: list[Step], frontier: Frontier) -> tuple[float, Frontier]:
+    """
+    Dry run of `sequence_to_schedule`: computes the cost (i.e., lateness plus setup time) that the runs of `sequence`
+    would have when scheduled after `frontier`, without creating a solution. The setup before the first run is
+    included. Returns the cost and the frontier after the sequence.
+    """
+    lateness, setups, frontier = _time_sequence(sequence, frontier)
+    return lateness / (7 * 24 * 3600) + setups, frontier
+
+
+def time_sequences(problem: Problem, sequences: np.ndarray, frontier: Frontier) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Batched version of the timing in `sequence_to_schedule`: computes the schedules of many candidate sequences (of the
+    same steps, or at least of the same number of steps) at once with NumPy.
+
+    For one sequence, the machines follow the recurrence end[p][t] = max(end[p][t-1], end[p-1][t]) + length[p][t], where
+    t is the position in the sequence and the length on machine C includes the setup time. Unrolling it gives
+        end[p][t] = S[p][t] + max(end[p][0], max_{j <= t} end[p-1][j] - S[p][j-1])
+    with S[p] the prefix sums of the lengths on machine p. So each machine takes one cumulative sum and one cumulative
+    maximum over all candidates, instead of a Python loop over the steps.
+
+    Args:
+        problem: the problem instance
+        sequences: 2-D array (candidates × steps) with in each row the indices of the slab caster steps, in order
+        frontier: the frontier after which all sequences are scheduled
+
+    Returns:
+        end: 3-D array (candidates × steps × 3) with the end time of each run on machine A, B and C
+        lateness: for each candidate, the total lateness in seconds
+        setups: for each candidate, the number of setups (including the one between `frontier` and the first run)
+    """
+    sequences = np.asarray(sequences, dtype=np.int64).reshape(len(sequences), -1)
+    runs = problem.step_run[sequences]
+    lengths = problem.step_length[problem.run_steps[runs]]  # candidates × steps × machines
+    metals = problem.run_metal[runs]
+    dues = problem.run_due[runs]
+
+    # metal changes, including the change from the frontier's metal (if there is one)
+    previous = np.empty_like(metals)
+    previous[:, 1:] = metals[:, :-1]
+    previous[:, 0] = metals[:, 0] if frontier.is_empty() else frontier.metal
+    changes = metals != previous
+    lengths[:, :, 2] += 3600 * changes
+
+    # initial end times of the machines
+    initial = np.empty((len(sequences), 3), dtype=np.int64)
+    initial[:] = frontier.end
+    if frontier.is_empty():
+        # the first step on the slab caster may use the time before the end of the maintenance
+        initial[:, 2] = 172800 - lengths[:, 0, 2]
+
+    end = np.empty_like(lengths)
+    end[:, :, 0] = initial[:, :1] + np.cumsum(lengths[:, :, 0], axis=1)
+    for p in (1, 2):
+        prefix = np.cumsum(lengths[:, :, p], axis=1)
+        ready = end[:, :, p-1] - (prefix - lengths[:, :, p])  # end[p-1][j] - S[p][j-1]
+        end[:, :, p] = prefix + np.maximum(initial[:, p:p+1], np.maximum.accumulate(ready, axis=1))
+
+    lateness = np.maximum(0, end[:, :, 2] - dues).sum(axis=1)
+    setups = changes.sum(axis=1)
+    return end, lateness, setups
+
+
+def evaluate_sequences(problem: Problem, sequences: np.ndarray, frontier: Frontier) -> np.ndarray:
+    """
+    Batched version of `evaluate_sequence`: returns for each candidate sequence (a row of `sequences`, see
+    `time_sequences`) the cost of scheduling it after `frontier`, including the setup before the first run.
+    """
+    _, lateness, setups = time_sequences(problem, sequences, frontier)
+    return lateness / (7 * 24 * 3600) + setups
+
+
+def apply_sequence(solution: Solution, sequence: list[Step], frontier: Frontier) -> Frontier:
+    """
+    Same as `sequence_to_schedule`, but modifies `solution` in place instead of copying it. `frontier` must be the
+    frontier of `solution`. Returns the frontier of the extended schedule.
+    """
+
+    assert all(s.phase() == 2 for s in sequence), "`sequence` must only consist of steps for the Slab Caster"
+    assert all_unique(s.index for s in sequence)
+    assert all(solution.start[s.index] is None for s in sequence)
+
+    _, _, frontier = _time_sequence(sequence, frontier, solution.start)
+    return frontier
+
+
+def sequence_to_schedule(solution: Solution, sequence: list[Step], frontier: Frontier | None = None) \
+        -> tuple[Solution, Frontier]:
+    """
+    Extend an existing schedule `solution` with a sequence of steps for machine C. The schedules for machine A and B are
+    inferred from machine C. This function does not modify `solution`, but returns a copy with changes, together with
+    the frontier of the extended schedule.
+    The `frontier` of `solution` can be passed to avoid recomputing it from scratch (which takes time proportional to
+    the size of the entire schedule). It is not modified.
+    """
+
+    if frontier is None:
+        frontier = Frontier.from_solution(solution)
+
+    solution = solution.copy()
+    frontier = apply_sequence(solution, sequence, frontier)
+    return solution, frontier
 
 
 # interval = time between due dates
@@ -82,28 +191,409 @@ def sequence_to_schedule(solution: Solution, sequence: list[Step]) -> Solution:
 # TODO: the very first step can be the largest one, since the time before 172800 is essentially free
 #       this is implemented naively, can be improved by trying all three options of longest run per metal
 
-def solve(problem: Problem) -> Solution:
+def solve(problem: Problem, workers: int = 1, metrics: Metrics | None = None, time_limit: float | None = None,
+          interval_budget: float | None = None, cancel: threading.Event | None = None, max_clusters: int = 4,
+          search: str = "exhaustive") -> Solution:
+    """
+    Solves `problem` greedily, one due date interval at a time (see `solve_interval`).
+    With `workers > 1`, the combinations of cluster counts of each interval are evaluated in parallel by a pool of that
+    many processes. The result is identical to the serial one.
+    Timings and statistics of the run are collected in `metrics` (see `Metrics`), which also decides whether progress
+    is printed. By default nothing is printed.
+
+    The search is anytime: it stops when `time_limit` seconds (for the whole problem) or `interval_budget` seconds (for
+    one interval) have passed, or when `cancel` is set (from another thread). The result is always a complete
+    schedule: each interval is scheduled with the best combination found before its budget ran out, or with the
+    default of one cluster per metal if none was evaluated. The limits apply to the search only: a stopped search runs
+    over by about the time of evaluating one combination (see `search_combinations`), and building the schedule of
+    every interval comes on top, which is what `solve` takes with `time_limit=0` (about 2 seconds for 100000 runs).
+
+    Args:
+        problem: the problem instance
+        workers: number of processes that evaluate the combinations of cluster counts
+        metrics: collects timings and statistics, and prints progress if it is verbose
+        time_limit: time limit in seconds for the whole search
+        interval_budget: time limit in seconds for the search of each interval
+        cancel: an event that stops the search when it is set
+        max_clusters: maximum number of clusters per metal
+        search: strategy for choosing the combination of cluster counts, see `search_combinations`
+
+    Returns: the schedule
+    """
+    if metrics is None:
+        metrics = Metrics()
+    if search not in SEARCH_STRATEGIES:
+        raise ValueError(f"unknown search strategy {search}, expected one of {sorted(SEARCH_STRATEGIES)}")
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+
     # partition the runs of `problem` into `subproblems` w.r.t. the due dates
     # the first subproblem corresponds to the first due date, the second to the second, etc.
     subproblems: list[list[Run]] = list_group_by(problem.runs, lambda r: r.due)
 
+    # the worker processes receive the problem once, when they are started (on fork, it is not even pickled)
+    pool = None
+    if workers > 1:
+        # the workers attach to the shared memory of each interval (see `solve_interval`), which registers it with the
+        # resource tracker; starting the tracker first makes the workers share it with this process, which unlinks it
+        resource_tracker.ensure_running()
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(problem,))
+
     # solve each subproblem in order (greedily) and simply concat schedules
-    solution = Solution(problem)  # create empty solution
-    for i, sub in enumerate(subproblems):
-        print(f"subproblem {i}")
-        solution = solve_interval(i == 0, solution, sub)
+    # the frontier (end times of the machines and last metal) is passed from one interval to the next
+    try:
+        with metrics.capture():
+            solution = Solution(problem)  # create empty solution
+            frontier = Frontier()
+            for i, sub in enumerate(subproblems):
+                metrics.log(f"subproblem {i}")
+                deadline = end_time
+                if interval_budget is not None:
+                    deadline = min(time.perf_counter() + interval_budget, deadline or math.inf)
+                solution, frontier = solve_interval(i == 0, solution, sub, frontier, pool, metrics, max_clusters,
+                                                    search, deadline, cancel, copy=False, workers=workers)
+    finally:
+        if pool is not None:
+            pool.terminate()
 
     return solution
 
 
+def read_intervals(filename: str, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """
+    Reads the problem csv file `filename` in chunks of `chunksize` rows, and yields the rows of each due date interval
+    as soon as it is complete. The runs in the file must be sorted by due date. At most one interval (plus one chunk)
+    is kept in memory.
+    """
+    pieces: list[pd.DataFrame] = []  # the rows of the current interval read so far
+    due = None
+    for chunk in pd.read_csv(filename, dtype=PROBLEM_CSV_DTYPES, chunksize=chunksize):
+        dues = chunk["due"].to_numpy()
+        if (np.diff(dues) < 0).any() or (due is not None and dues[0] < due):
+            raise ValueError(f"the runs in {filename} must be sorted by due date")
+
+        # split the chunk where the due date changes
+        boundaries = [0] + (np.flatnonzero(np.diff(dues)) + 1).tolist() + [len(chunk)]
+        for lo, hi in zip(boundaries, boundaries[1:]):
+            if due is not None and dues[lo] != due:
+                yield pd.concat(pieces)
+                pieces = []
+            pieces.append(chunk.iloc[lo:hi])
+            due = dues[lo]
+
+    if len(pieces) > 0:
+        yield pd.concat(pieces)
+
+
+def solve_stream(filename: str, chunksize: int = 100000, metrics: Metrics | None = None) -> Iterator[pd.DataFrame]:
+    """
+    Streaming version of `solve`: reads the runs of the problem csv file `filename` (which must be sorted by due date)
+    interval by interval, solves each interval as soon as it has been read, and yields the rows of its schedule (in
+    the format of `write_solution`). Only the frontier is passed from one interval to the next, so the memory use is
+    bounded by the size of the largest interval instead of the whole horizon.
+
+    Whether any run is late is only known at the end, so TooLate_Weeks is always written as a float (see
+    `solution_columns`).
+    """
+    if metrics is None:
+        metrics = Metrics()
+    frontier = Frontier()
+    offset = 0
+    for i, df in enumerate(read_intervals(filename, chunksize)):
+        metrics.log(f"subproblem {i}")
+        problem = problem_from_dataframe(df)
+        previous_metal = frontier.metal
+        solution, frontier = solve_interval(i == 0, Solution(problem), problem.runs, frontier, metrics=metrics,
+                                            copy=False)
+
+        rows = solution_to_dataframe(solution, previous_metal, float_lateness=True)
+        rows.index += offset
+        offset += len(rows)
+        yield rows
+
+
+def solve_to_csv(problem_csv: str, solution_csv: str, chunksize: int = 100000, metrics: Metrics | None = None) -> None:
+    """
+    Solves the problem in `problem_csv` with `solve_stream`, and writes the schedule of each interval to `solution_csv`
+    as soon as it is solved. The file is the same as that of `write_solution(solve(read_problem(problem_csv)))`,
+    except when no run is late: `write_solution` then writes the lateness as integers (0), and this function as floats
+    (0.0).
+    """
+    with open(solution_csv, "w", newline="") as f:
+        for i, rows in enumerate(solve_stream(problem_csv, chunksize, metrics)):
+            rows.to_csv(f, header=(i == 0))
+
+
+# the maximum number of steps (candidates × steps of the interval) that `evaluate_combinations` times at once; the
+# timing arrays take about 150 bytes per step, so this bounds their memory use to about 150 MB
+MAX_BATCH_ELEMENTS = 2 ** 20
+
 
-def solve_interval(firstInterval: bool, solution: Solution, runs: list[Run]) -> Solution:
+def combination_to_indices(steps_by_metal: list[list[Step]], combination: tuple[int, ...], firstInterval: bool,
+                           cache: ClusterCache | None = None) -> np.ndarray:
+    """
+    Same as `combination_to_sequence`, but returns the indices of the steps of the sequence as an array.
+    """
+    if cache is None:
+        cache = ClusterCache()
+    sequence = sorted_cluster_indices(steps_by_metal, combination, cache)  # TODO: try multiple orderings
+
+    # if first interval, use the 'free' buffer space at the start of the solution
+    if firstInterval:
+        problem = steps_by_metal[0][0].problem
+        metals = problem.run_metal[problem.step_run[sequence]]
+        candidates = np.flatnonzero(metals == metals[0])
+        # the first of the longest steps of the first metal
+        i = candidates[np.argmax(problem.step_length[sequence[candidates]])]
+        sequence = np.concatenate([sequence[i:i+1], sequence[:i], sequence[i+1:]])
+        # TODO if the max_job is too lang for buffer space, then we should actually look for the longest
+        #      job that fits, and put that one first
+
+    return sequence
+
+
+def combination_to_sequence(steps_by_metal: list[list[Step]], combination: tuple[int, ...], firstInterval: bool,
+                            cache: ClusterCache | None = None) -> list[Step]:
+    """
+    Builds the sequence for the slab caster of one interval, given the number of clusters for each metal in
+    `combination`. The steps are taken from `steps_by_metal`, which contains one list of steps for each metal.
+    """
+    steps = steps_by_metal[0][0].problem.steps
+    return [steps[i] for i in combination_to_indices(steps_by_metal, combination, firstInterval, cache).tolist()]
+
+
+def evaluate_combinations(steps_by_metal: list[list[Step]], combinations: list[tuple[int, ...]], firstInterval: bool,
+                          frontier: Frontier, cache: ClusterCache | None = None, metrics: Metrics | None = None) \
+        -> np.ndarray:
+    """
+    Returns for each combination of cluster counts the cost of the corresponding sequence (see
+    `combination_to_sequence`) when it is scheduled after `frontier`. The sequences are built and evaluated in batches
+    of at most MAX_BATCH_ELEMENTS steps in total (but at least one sequence), so the memory use does not grow with the
+    number of combinations.
+    The time spent on building the sequences and on evaluating them is added to the phases "sequencing" and
+    "evaluation" of `metrics` (if given).
+    """
+    if metrics is None:
+        metrics = Metrics()
+    if len(combinations) == 0:
+        return np.zeros(0)
+    problem = steps_by_metal[0][0].problem
+    size = max(1, MAX_BATCH_ELEMENTS // sum(len(steps) for steps in steps_by_metal))
+    costs = []
+    for i in range(0, len(combinations), size):
+        with metrics.timer("sequencing"):
+            sequences = np.array([
+                combination_to_indices(steps_by_metal, combination, firstInterval, cache)
+                for combination in combinations[i:i+size]
+            ])
+        with metrics.timer("evaluation"):
+            costs.append(evaluate_sequences(problem, sequences, frontier))
+    return np.concatenate(costs)
+
+
+SEARCH_STRATEGIES = {"exhaustive", "descent", "beam"}
+
+
+def _expired(deadline: float | None, cancel: threading.Event | None) -> bool:
+    """Returns whether the `deadline` (a value of `time.perf_counter`) has passed, or `cancel` has been set."""
+    return (deadline is not None and time.perf_counter() >= deadline) or (cancel is not None and cancel.is_set())
+
+
+def search_combinations(evaluate: Callable[[list[tuple[int, ...]]], np.ndarray], num_metals: int, max_clusters: int,
+                        search: str = "exhaustive", deadline: float | None = None,
+                        cancel: threading.Event | None = None, batch_size: int = 64, beam_width: int = 4) \
+        -> tuple[dict[tuple[int, ...], float], bool]:
+    """
+    Searches the combinations of cluster counts, i.e., the vectors with for each of the `num_metals` metals a number of
+    clusters between 1 and `max_clusters`, for the one with the lowest cost. The strategies are:
+        exhaustive: all max_clusters**num_metals combinations, with the fewest clusters in total first
+        descent: coordinate descent, which tries every cluster count for one metal at a time (keeping the others fixed)
+                 until no metal improves; it starts from one cluster per metal, and is restarted from `max_clusters`
+                 clusters per metal
+        beam: fixes the cluster counts metal by metal (the metals that are not fixed yet get one cluster), keeping the
+              `beam_width` best partial combinations
+    Without a `deadline` (a value of `time.perf_counter`) or `cancel`, the combinations are evaluated in batches of
+    `batch_size`. Otherwise, the search stops before a batch when the deadline has passed or `cancel` has been set,
+    and the batches start with a single combination and then double (up to `batch_size`), but never hold more
+    combinations than fit in the time that is left, going by the time measured per combination so far. A stopped
+    search therefore exceeds the deadline by about the time of one combination.
+
+    Args:
+        evaluate: returns the cost of each combination in a list
+        num_metals: number of metals
+        max_clusters: maximum number of clusters per metal
+        search: the strategy, see SEARCH_STRATEGIES
+        deadline: the time at which the search stops
+        cancel: an event that stops the search when it is set
+        batch_size: maximum number of combinations that are evaluated at once
+        beam_width: number of partial combinations that are kept by the beam search
+
+    Returns:
+        costs: the cost of every combination that was evaluated
+        complete: whether the search finished (instead of being stopped)
+    """
+    costs: dict[tuple[int, ...], float] = {}
+    timed = deadline is not None or cancel is not None
+    size = 1  # the size of the last batch
+    seconds_per_combination = 0.0  # of the last batch
+
+    def run(combinations: list[tuple[int, ...]]) -> bool:
+        # evaluates the combinations that were not evaluated yet, returns False if the search has to stop
+        nonlocal size, seconds_per_combination
+        new = [c for c in dict.fromkeys(combinations) if c not in costs]
+        i = 0
+        while i < len(new):
+            if not timed:
+                size = batch_size
+            else:
+                if _expired(deadline, cancel):
+                    return False
+                if i > 0 or len(costs) > 0:
+                    size = min(2 * size, batch_size)
+                if deadline is not None and seconds_per_combination > 0:
+                    size = max(1, min(size, int((deadline - time.perf_counter()) / seconds_per_combination)))
+            batch = new[i:i+size]
+            start = time.perf_counter()
+            costs.update(zip(batch, (float(cost) for cost in evaluate(batch))))
+            seconds_per_combination = (time.perf_counter() - start) / len(batch)
+            i += len(batch)
+        return True
+
+    def best(combinations: list[tuple[int, ...]]) -> tuple[int, ...]:
+        # ties are broken in favour of the smallest combination, like the first minimum of an exhaustive sweep
+        return min(combinations, key=lambda c: (costs[c], c))
+
+    if search == "exhaustive":
+        return costs, run(sorted(compute_combinations(num_metals, max_clusters), key=sum))
+
+    if search == "descent":
+        for start in dict.fromkeys([(1,) * num_metals, (max_clusters,) * num_metals]):
+            current = start
+            if not run([current]):
+                return costs, False
+            improved = True
+            while improved:
+                improved = False
+                for m in range(num_metals):
+                    neighbours = [current[:m] + (k,) + current[m+1:] for k in range(1, max_clusters + 1)]
+                    if not run(neighbours):
+                        return costs, False
+                    if best(neighbours) != current:
+                        current = best(neighbours)
+                        improved = True
+        return costs, True
+
+    if search == "beam":
+        beam = [()]
+        for m in range(num_metals):
+            partial = [b + (k,) for b in beam for k in range(1, max_clusters + 1)]
+            completed = {p: p + (1,) * (num_metals - m - 1) for p in partial}
+            if not run(list(completed.values())):
+                return costs, False
+            beam = sorted(partial, key=lambda p: (costs[completed[p]], completed[p]))[:beam_width]
+        return costs, True
+
+    raise ValueError(f"unknown search strategy {search}, expected one of {sorted(SEARCH_STRATEGIES)}")
+
+
+# the problem instance in a worker process of `solve`, set once when the worker starts
+_worker_problem: Problem | None = None
+
+# the interval in a worker process: the name of its shared memory, its steps by metal and their clusterings
+_worker_interval: tuple[str, list[list[Step]], ClusterCache] | None = None
+
+
+def _init_worker(problem: Problem) -> None:
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _share_interval(steps_by_metal: list[list[Step]], cache: ClusterCache, max_clusters: int) \
+        -> tuple[shared_memory.SharedMemory, list]:
+    """
+    Writes the steps of an interval and their sorted clusterings (see `ClusterCache.get_sorted`) for every number of
+    clusters up to `max_clusters` to shared memory, so that the worker processes receive them once per interval
+    instead of with every task. Returns the shared memory (to be unlinked by the caller when the interval is done) and
+    its layout: for each metal, its number of steps and for each k the mean length and size of each cluster.
+    """
+    arrays = []
+    layout = []
+    for steps in steps_by_metal:
+        arrays.append(np.array([s.index for s in steps], dtype=np.int64))
+        clusterings = []
+        for k in range(1, max_clusters + 1):
+            clusters = cache.get_sorted(steps, k)
+            arrays.extend(indices for _, indices in clusters)
+            clusterings.append([(mean, len(indices)) for mean, indices in clusters])
+        layout.append((len(steps), clusterings))
+    data = np.concatenate(arrays)
+    shared = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+    np.ndarray(data.shape, dtype=np.int64, buffer=shared.buf)[:] = data
+    return shared, layout
+
+
+def _load_interval(name: str, layout: list) -> tuple[list[list[Step]], ClusterCache]:
+    """Reads the interval that `_share_interval` wrote to the shared memory `name` (in a worker process)."""
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        size = sum(n + sum(length for c in clusterings for _, length in c) for n, clusterings in layout)
+        data = np.ndarray(size, dtype=np.int64, buffer=shared.buf).copy()
+    finally:
+        shared.close()
+
+    steps = _worker_problem.steps
+    steps_by_metal = []
+    cache = ClusterCache()
+    offset = 0
+    for n, clusterings in layout:
+        metal_steps = [steps[i] for i in data[offset:offset + n].tolist()]
+        offset += n
+        for k, clusters in enumerate(clusterings, 1):
+            sorted_clusters = []
+            for mean, length in clusters:
+                sorted_clusters.append((mean, data[offset:offset + length]))
+                offset += length
+            cache.set_sorted(metal_steps, k, sorted_clusters)
+        steps_by_metal.append(metal_steps)
+    return steps_by_metal, cache
+
+
+def _evaluate_combinations_worker(task: tuple[str, list, list[tuple[int, ...]], bool, Frontier]) -> list[float]:
+    """
+    Runs `evaluate_combinations` in a worker process, for the interval in the shared memory of the task (see
+    `_share_interval`), which is only read by the first task of the interval. Returns the cost of each combination of
+    the task.
+    """
+    global _worker_interval
+    name, layout, combinations, firstInterval, frontier = task
+    if _worker_interval is None or _worker_interval[0] != name:
+        _worker_interval = (name, *_load_interval(name, layout))
+    _, steps_by_metal, cache = _worker_interval
+    return evaluate_combinations(steps_by_metal, combinations, firstInterval, frontier, cache).tolist()
+
+
+def solve_interval(firstInterval: bool, solution: Solution, runs: list[Run], frontier: Frontier | None = None,
+                   pool: multiprocessing.pool.Pool | None = None, metrics: Metrics | None = None,
+                   max_clusters: int = 4, search: str = "exhaustive", deadline: float | None = None,
+                   cancel: threading.Event | None = None, copy: bool = True, workers: int = 1) \
+        -> tuple[Solution, Frontier]:
+    """
+    Extends `solution` with a schedule for `runs`, which share a due date. The last steps of each metal are clustered
+    by length, and the combination of cluster counts (at most `max_clusters` per metal) with the lowest cost is
+    searched with `search_combinations`. If the `deadline` passes or `cancel` is set before any combination has been
+    evaluated, one cluster per metal is used. Returns the extended solution and its frontier.
+    With a `pool` (of `workers` processes, see `solve`), each batch of combinations is split in one task per worker.
+    The clusterings are fitted here, and sent to the workers once for the interval.
+    By default `solution` is not modified, but copied (which takes time proportional to the whole schedule). With
+    `copy=False` it is extended in place, as `solve` does for the solution it builds.
+    """
+    if metrics is None:
+        metrics = Metrics()
     assert all(r.due == runs[0].due for r in runs), "all runs must share a due date"
     assert all(all(solution.start[s.index] is None for s in r.steps) for r in runs)
+    start_time = time.perf_counter()
 
-    # determine metal of slab caster at the end of `solution` (if it's not empty)
-    last_run = solution.get_last_run()
-    last_metal = None if last_run is None else last_run.metal
+    if frontier is None:
+        frontier = Frontier.from_solution(solution)
 
     # partition the last steps of `runs` w.r.t. metal type
     runs_by_metal: list[list[Run]] = list_group_by(runs, lambda r: r.metal)
@@ -112,33 +602,82 @@ def solve_interval(firstInterval: bool, solution: Solution, runs: list[Run]) ->
 
     # for each metal type, cluster the steps w.r.t. their length
     # here we try different numbers of clusters, and take the clustering that yields the min cost
-    best_solution: Solution | None = None
-    best_cost: float = math.inf  # min cost so far
-    for combination in compute_combinations(num_metals, 4):  # TODO: 4 clusters per metal for now
-        clusters = cluster_step_classes_by_length_then_sort(steps_by_metal, combination)
-        sequence = [s for c in clusters for s in c]  # flatten the clusters     TODO: try multiple orderings
-
-        # if first interval, use the 'free' buffer space at the start of the solution
-        if firstInterval:
-            first_metal = sequence[0].run.metal
-            max_job = max([s for s in sequence if s.run.metal == first_metal], key=lambda s: s.length)
-            sequence.remove(max_job)
-            sequence.insert(0,max_job)
-            # TODO if the max_job is too lang for buffer space, then we should actually look for the longest
-            #      job that fits, and put that one first
-
-        # extend the solution (up to the last due date) with the current clustering
-        new_solution = sequence_to_schedule(solution, sequence)
-
-        # compute cost and take solution whose cost is minimal
-        new_cost = new_solution.cost(runs)
-        new_cost += last_metal is not None and sequence[0].run.metal != last_metal  # add one hour of setup time if first metal is different
-        if best_solution is None or new_cost < best_cost:
-            best_solution = new_solution
-            best_cost = new_cost
-
-        comb_string = ", ".join([str(i) for i in combination])
-        print(f"    with [{comb_string}] clusters, cost = {new_cost}")
-
-    # flatten clusters (temp)
-    return best_solution
+    # the clustering of a metal into k clusters is the same for every combination, so it is cached
+    # (and fitted up front, so the clustering is timed separately from building the sequences)
+    # if there is no time left, only the single cluster of each metal is computed (which is just a sort)
+    expired = _expired(deadline, cancel)
+    cache = ClusterCache(k_max=1 if expired else max_clusters)
+    if not expired:
+        with metrics.timer("clustering"):
+            for steps in steps_by_metal:
+                cache.get(steps, 1)
+
+    # compute the cost of extending the solution (up to the last due date) with the combinations of the search
+    # this includes one hour of setup time if the first metal is different from the last metal of `solution`
+    shared, layout = None, None
+
+    def evaluate(combinations: list[tuple[int, ...]]) -> np.ndarray:
+        if pool is None:
+            return evaluate_combinations(steps_by_metal, combinations, firstInterval, frontier, cache, metrics)
+        # split the combinations in consecutive chunks (one per worker), so the costs come back in the same order
+        chunk_size = -(-len(combinations) // workers)
+        tasks = [
+            (shared.name, layout, combinations[i:i+chunk_size], firstInterval, frontier)
+            for i in range(0, len(combinations), chunk_size)
+        ]
+        with metrics.timer("evaluation"):
+            return np.array([cost for costs in pool.map(_evaluate_combinations_worker, tasks) for cost in costs])
+
+    # the batches of the search are as large as `evaluate_combinations` times at once (which depends on the size of
+    # the interval), so that a batch does not hold more sequences than fit in the memory budget
+    batch_size = max(1, MAX_BATCH_ELEMENTS // len(runs))
+    costs, complete = {}, False
+    if not expired:
+        if pool is not None:
+            shared, layout = _share_interval(steps_by_metal, cache, max_clusters)
+        try:
+            costs, complete = search_combinations(evaluate, num_metals, max_clusters, search, deadline, cancel,
+                                                  batch_size)
+        finally:
+            if shared is not None:
+                shared.close()
+                shared.unlink()
+
+    if metrics.verbose:
+        for combination in sorted(costs):
+            comb_string = ", ".join([str(i) for i in combination])
+            metrics.log(f"    with [{comb_string}] clusters, cost = {costs[combination]}")
+
+    # only the best sequence is turned into a schedule (the smallest combination in case of ties)
+    if len(costs) > 0:
+        best_combination = min(costs, key=lambda c: (costs[c], c))
+    else:
+        best_combination = (1,) * num_metals
+        metrics.log("    no time left, using one cluster per metal")
+    with metrics.timer("sequencing"):
+        best_sequence = combination_to_sequence(steps_by_metal, best_combination, firstInterval, cache)
+
+    metrics.log(f"    clustering cache: {cache.hits} hits, {cache.misses} misses")
+    metrics.count("candidates", len(costs))
+    metrics.count("cache_hits", cache.hits)
+    metrics.count("cache_misses", cache.misses)
+    metrics.count("stopped_intervals", not complete)
+
+    # extend the solution with the best sequence (as `sequence_to_schedule` does, but timing the copy separately)
+    if copy:
+        with metrics.timer("copy"):
+            solution = solution.copy()
+    with metrics.timer("scheduling"):
+        frontier = apply_sequence(solution, best_sequence, frontier)
+
+    metrics.intervals.append({
+        "index": len(metrics.intervals),
+        "due": int(runs[0].due),
+        "runs": len(runs),
+        "candidates": len(costs),
+        "complete": complete,
+        "best_combination": list(best_combination),
+        "best_cost": costs.get(best_combination),
+        "seconds": time.perf_counter() - start_time,
+    })
+    return solution, frontier
@@ -0,0 +1,197 @@
+from data_structures import *
+from greedy_partitioner import apply_sequence, solve_interval, SEARCH_STRATEGIES
+from metrics import Metrics
+from utils import *
+
+
+class ProblemDiff:
+    """
+    A class representing a change of a problem instance. Runs are identified by the name of any of their steps (for
+    example the name of the step on the slab caster).
+
+    Attributes:
+        added: pd.DataFrame | None
+            The new runs, in our csv format (see `read_problem`)
+        removed: list[str]
+            The runs that are removed
+        lengths: dict[str, int]
+            For each step whose length changes, its new length in seconds
+        dues: dict[str, int]
+            For each run whose due date changes, its new due date in seconds
+    """
+
+    def __init__(self, added: pd.DataFrame | None = None, removed: list[str] | None = None,
+                 lengths: dict[str, int] | None = None, dues: dict[str, int] | None = None):
+        self.added: pd.DataFrame | None = added
+        self.removed: list[str] = [] if removed is None else removed
+        self.lengths: dict[str, int] = {} if lengths is None else lengths
+        self.dues: dict[str, int] = {} if dues is None else dues
+
+
+def apply_diff(problem: Problem, diff: ProblemDiff) -> tuple[Problem, np.ndarray]:
+    """
+    Applies `diff` to `problem` (which is not modified). Returns the new problem, and for each run of `problem` its
+    index in the new problem (or -1 if it was removed). The added runs come after the existing runs with the same due
+    date. The arrays of the new problem are built directly (without creating the views of `problem`), and the steps
+    of `diff` are looked up by binary search (see `find_steps`).
+    """
+    step_length = problem.step_length.copy()
+    step_length[find_steps(problem, list(diff.lengths))] = list(diff.lengths.values())
+    run_due = problem.run_due.copy()
+    run_due[problem.step_run[find_steps(problem, list(diff.dues))]] = list(diff.dues.values())
+    kept = np.ones(len(run_due), dtype=bool)
+    kept[problem.step_run[find_steps(problem, diff.removed)]] = False
+
+    added = diff.added if diff.added is not None else pd.DataFrame(columns=list(PROBLEM_CSV_DTYPES))
+    added_names = np.concatenate([added[f"step{p+1}"].to_numpy(dtype=str) for p in range(3)])
+    added_lengths = np.concatenate([added[f"len{p+1}"].to_numpy(dtype=np.int64) for p in range(3)])
+
+    # the steps of the kept runs stay sorted by name, and the added steps are inserted in between
+    kept_steps = np.flatnonzero(kept[problem.step_run])
+    kept_names = problem.step_name[kept_steps]
+    order = np.argsort(added_names, kind="stable")
+    positions = np.searchsorted(kept_names, added_names[order])
+    step_name = np.insert(kept_names.astype(np.promote_types(kept_names.dtype, added_names.dtype)), positions,
+                          added_names[order])
+    step_length = np.insert(step_length[kept_steps], positions, added_lengths[order])
+
+    # the new indices of the steps of the kept runs (-1 for removed steps), and of the added steps
+    step_map = np.full(len(problem.step_name), -1, dtype=np.int64)
+    step_map[kept_steps] = np.arange(len(kept_steps)) + np.searchsorted(positions, np.arange(len(kept_steps)), "right")
+    added_steps = np.empty(len(added_names), dtype=np.int64)
+    added_steps[order] = positions + np.arange(len(positions))
+
+    # the runs of the new problem are sorted by due date, as in `problem_from_dataframe`
+    run_metal = np.concatenate([problem.run_metal[kept], added["metal"].to_numpy(dtype=np.int64)])
+    run_due = np.concatenate([run_due[kept], added["due"].to_numpy(dtype=np.int64)])
+    run_steps = np.concatenate([step_map[problem.run_steps[kept]], added_steps.reshape(3, -1).T])
+    runs = np.argsort(run_due, kind="stable")
+    rank = np.empty(len(runs), dtype=np.int64)
+    rank[runs] = np.arange(len(runs))
+    run_map = np.full(len(kept), -1, dtype=np.int64)
+    run_map[kept] = rank[:kept.sum()]
+
+    new = Problem(step_name=step_name, step_length=step_length, run_metal=run_metal[runs], run_due=run_due[runs],
+                  run_steps=run_steps[runs])
+    return new, run_map
+
+
+def _subproblem(problem: Problem, runs: np.ndarray) -> tuple[Problem, np.ndarray]:
+    """
+    Returns the problem that consists of the `runs` of `problem` (in this order), together with the indices in
+    `problem` of its steps. Its views are created for these runs only, instead of for all runs of `problem`.
+    """
+    steps = np.sort(problem.run_steps[runs].ravel())
+    sub = Problem(step_name=problem.step_name[steps], step_length=problem.step_length[steps],
+                  run_metal=problem.run_metal[runs], run_due=problem.run_due[runs],
+                  run_steps=np.searchsorted(steps, problem.run_steps[runs]))
+    return sub, steps
+
+
+def _end_frontier(end: np.ndarray, metal: np.ndarray) -> Frontier:
+    """Returns the frontier of a schedule of runs with end times `end` (one row per run) and metal types `metal`."""
+    return Frontier(end.max(axis=0).astype(np.int64).tolist(), int(metal[np.argmax(end[:, 2])]))
+
+
+def reschedule(previous: Solution, diff: ProblemDiff, freeze_time: int = 0, metrics: Metrics | None = None,
+               max_clusters: int = 4, search: str = "exhaustive") -> Solution:
+    """
+    Updates the schedule `previous` after its problem has changed by `diff`, without solving the whole problem again.
+    Runs whose first step starts before `freeze_time` are frozen: they keep their start times (and must not be changed
+    by `diff`). The remaining runs are scheduled after them, one due date interval at a time as in `solve`. Only the
+    intervals that are touched by `diff` (that gain or lose runs, or contain a run whose length or due date changed)
+    are solved again with `solve_interval`. The other intervals keep the order of their runs on the slab caster: their
+    start times are copied from `previous` if the interval starts from the same frontier as in `previous` (which
+    assumes that `previous` was built one interval at a time, as `solve` and `reschedule` do), and they are only
+    re-timed if an earlier interval has shifted.
+
+    The views (Step and Run objects) are only created for the runs of the intervals that are solved or re-timed (see
+    `_subproblem`), so that the time spent in Python is proportional to the size of the change, not of the horizon.
+
+    Args:
+        previous: a complete solution of the problem before the change
+        diff: the change of the problem
+        freeze_time: the time (in seconds) before which the schedule is fixed
+        metrics: collects timings and statistics (see `Metrics`), including the number of re-solved intervals
+        max_clusters: maximum number of clusters per metal in the re-solved intervals, see `solve`
+        search: strategy for choosing the combination of cluster counts in the re-solved intervals, see `solve`
+
+    Returns: a solution of the changed problem
+    """
+    if metrics is None:
+        metrics = Metrics()
+    if search not in SEARCH_STRATEGIES:
+        raise ValueError(f"unknown search strategy {search}, expected one of {sorted(SEARCH_STRATEGIES)}")
+
+    old = previous.problem
+    problem, run_map = apply_diff(old, diff)
+    old_start = np.array(previous.start, dtype=float)  # NaN for unscheduled steps
+
+    # the due dates (in the new problem) of the intervals that have to be solved again
+    touched = set()
+    changed_runs = old.step_run[find_steps(old, [*diff.removed, *diff.lengths, *diff.dues])]
+    touched.update(old.run_due[changed_runs].tolist())
+    touched.update(diff.dues.values())
+    if diff.added is not None:
+        touched.update(diff.added["due"].tolist())
+    unscheduled = np.isnan(old_start[old.run_steps]).any(axis=1)
+    touched.update(old.run_due[unscheduled].tolist())
+
+    # frozen runs keep their start times
+    frozen = ~unscheduled & (np.nan_to_num(old_start[old.run_steps[:, 0]], nan=np.inf) < freeze_time)
+    if frozen[changed_runs].any():
+        raise ValueError(f"runs that start before {freeze_time} cannot be changed")
+    start = np.zeros(len(problem.step_name), dtype=np.int64)  # the start times of the new schedule
+    frontier = Frontier()
+    if frozen.any():
+        old_steps = old.run_steps[frozen]
+        steps = problem.run_steps[run_map[frozen]]
+        start[steps] = old_start[old_steps]
+        frontier = _end_frontier(old_start[old_steps] + problem.step_length[steps], problem.run_metal[run_map[frozen]])
+    metrics.count("frozen_runs", int(frozen.sum()))
+
+    # for each run of the new problem, its index in `previous` (-1 for added runs)
+    old_runs = np.full(len(problem.run_due), -1, dtype=np.int64)
+    old_runs[run_map[run_map >= 0]] = np.flatnonzero(run_map >= 0)
+    is_frozen = np.zeros(len(problem.run_due), dtype=bool)
+    is_frozen[run_map[frozen]] = True
+
+    # the remaining runs, split in intervals by due date (runs are sorted by due date)
+    rest = np.flatnonzero(~is_frozen)
+    intervals = np.split(rest, np.flatnonzero(np.diff(problem.run_due[rest])) + 1) if len(rest) > 0 else []
+    # the frontier of `previous` after the last interval, if that interval was not re-solved (without frozen runs, the
+    # first interval starts from an empty schedule in `previous` too)
+    old_frontier = None if frozen.any() else Frontier()
+    for runs in intervals:
+        due = int(problem.run_due[runs[0]])
+        if due in touched:
+            metrics.log(f"re-solving interval with due date {due}")
+            metrics.count("resolved_intervals")
+            sub, steps = _subproblem(problem, runs)
+            solution, frontier = solve_interval(frontier.is_empty(), Solution(sub), sub.runs, frontier, None, metrics,
+                                                max_clusters, search, copy=False)
+            start[steps] = solution.start
+            old_frontier = None
+            continue
+
+        metrics.count("reused_intervals")
+        old_steps = old.run_steps[old_runs[runs]]
+        same = old_frontier is not None and frontier.end == old_frontier.end and frontier.metal == old_frontier.metal
+        old_frontier = _end_frontier(old_start[old_steps] + problem.step_length[problem.run_steps[runs]],
+                                     problem.run_metal[runs])
+        if same:
+            # the interval starts as in `previous`, so its schedule is the same
+            start[problem.run_steps[runs]] = old_start[old_steps]
+            frontier = old_frontier
+        else:
+            # an earlier interval has shifted, so the runs are re-timed in their order on the slab caster
+            metrics.count("retimed_intervals")
+            sub, steps = _subproblem(problem, runs[np.argsort(old_start[old_steps[:, 2]], kind="stable")])
+            solution = Solution(sub)
+            with metrics.timer("scheduling"):
+                frontier = apply_sequence(solution, [sub.steps[i] for i in sub.run_steps[:, 2].tolist()], frontier)
+            start[steps] = solution.start
+
+    solution = Solution(problem)
+    solution.start = start.tolist()
+    return solution
@@ -0,0 +1,199 @@
+from data_structures import *
+from greedy_partitioner import apply_sequence
+import random
+import time
+
+
+class SequenceState:
+    """
+    A class representing a sequence of runs on the slab caster, together with the timing of its schedule. For every
+    position in the sequence, it stores the end times of the run on each machine. This makes it possible to evaluate a
+    change of the sequence by re-timing only the positions after the change (see `delta`).
+
+    Attributes:
+        problem: Problem
+            The problem instance
+        runs: list[int]
+            The indices of the runs in the order in which they are performed
+        end: list[tuple[int, int, int]]
+            For each position, the end times of the run on machine A, B and C
+        late: list[int]
+            For each position, the lateness of the run in seconds
+        setup: list[int]
+            For each position, whether there is a setup before the run (0 or 1)
+    """
+
+    def __init__(self, problem: Problem, runs: list[int]):
+        self.problem: Problem = problem
+        self.runs: list[int] = runs
+
+        # the data of the runs, as Python lists for fast access to single elements
+        self._len: list[list[int]] = problem.step_length[problem.run_steps].tolist()
+        self._metal: list[int] = problem.run_metal.tolist()
+        self._due: list[int] = problem.run_due.tolist()
+
+        self.end: list[tuple[int, int, int]] = []
+        self.late: list[int] = []
+        self.setup: list[int] = []
+        self._retime_suffix(0)
+
+    def cost(self) -> float:
+        """Returns the cost (i.e., lateness plus setup time) of the schedule."""
+        return sum(self.late) / (7 * 24 * 3600) + sum(self.setup)
+
+    def _initial(self, first: int) -> tuple[tuple[int, int, int], int]:
+        """
+        Returns the state before the first position (end times of the machines and metal) if the sequence starts with
+        run `first`. The first step on the slab caster may use the time before the end of the maintenance.
+        """
+        return (0, 0, 172800 - self._len[first][2]), self._metal[first]
+
+    def _step(self, state: tuple[int, int, int], metal: int, run: int) -> tuple[tuple[int, int, int], int]:
+        """Returns the end times of `run` when it is performed after `state`, and whether it needs a setup."""
+        a, b, c = state
+        length = self._len[run]
+        setup = self._metal[run] != metal
+        a = a + length[0]
+        b = max(b, a) + length[1]
+        c = max(c, b) + length[2] + 3600 * setup
+        return (a, b, c), setup
+
+    def _retime_suffix(self, lo: int) -> None:
+        """Recomputes the timing of all positions from `lo` onwards."""
+        del self.end[lo:], self.late[lo:], self.setup[lo:]
+        if lo == 0:
+            state, metal = self._initial(self.runs[0])
+        else:
+            state, metal = self.end[lo-1], self._metal[self.runs[lo-1]]
+        for run in self.runs[lo:]:
+            state, setup = self._step(state, metal, run)
+            metal = self._metal[run]
+            self.end.append(state)
+            self.late.append(max(0, state[2] - self._due[run]))
+            self.setup.append(setup)
+
+    def delta(self, lo: int, middle: list[int]) -> float:
+        """
+        Returns the change in cost if the positions `lo, ..., lo + len(middle) - 1` are replaced by the runs `middle`
+        (which must be a permutation of the runs at these positions). Only the suffix starting at `lo` is re-timed, and
+        this stops as soon as the end times and metal after the changed positions are equal to the current ones, since
+        then the rest of the schedule is unchanged.
+        """
+        if lo == 0:
+            state, metal = self._initial(middle[0])
+        else:
+            state, metal = self.end[lo-1], self._metal[self.runs[lo-1]]
+
+        late = 0
+        setups = 0
+        t = lo
+        for run in middle:
+            state, setup = self._step(state, metal, run)
+            metal = self._metal[run]
+            late += max(0, state[2] - self._due[run]) - self.late[t]
+            setups += setup - self.setup[t]
+            t += 1
+        while t < len(self.runs) and (state != self.end[t-1] or metal != self._metal[self.runs[t-1]]):
+            run = self.runs[t]
+            state, setup = self._step(state, metal, run)
+            metal = self._metal[run]
+            late += max(0, state[2] - self._due[run]) - self.late[t]
+            setups += setup - self.setup[t]
+            t += 1
+
+        return late / (7 * 24 * 3600) + setups
+
+    def apply(self, lo: int, middle: list[int]) -> None:
+        """
+        Replaces the positions starting at `lo` by the runs `middle`, and updates the timing. As in `delta`, the
+        re-timing stops as soon as the end times and metal after the changed positions are equal to the old ones.
+        """
+        hi = lo + len(middle)
+        old_runs = self.runs[lo:hi]
+        self.runs[lo:hi] = middle
+        if lo == 0:
+            state, metal = self._initial(middle[0])
+        else:
+            state, metal = self.end[lo-1], self._metal[self.runs[lo-1]]
+
+        for t in range(lo, len(self.runs)):
+            run = self.runs[t]
+            old_end = self.end[t]
+            old_metal = self._metal[old_runs[t - lo] if t < hi else run]
+            state, setup = self._step(state, metal, run)
+            metal = self._metal[run]
+            self.end[t] = state
+            self.late[t] = max(0, state[2] - self._due[run])
+            self.setup[t] = setup
+            if t >= hi - 1 and state == old_end and metal == old_metal:
+                break
+
+    def to_solution(self) -> Solution:
+        """Creates the schedule of this sequence."""
+        solution = Solution(self.problem)
+        steps = self.problem.steps
+        apply_sequence(solution, [steps[self.problem.run_steps[r, 2]] for r in self.runs], Frontier())
+        return solution
+
+
+def improve(solution: Solution, time_limit: float | None = 1.0, max_iterations: int | None = None,
+            max_distance: int = 50, max_block: int = 8, seed: int = 0) -> Solution:
+    """
+    Improves `solution` by local search over the sequence of runs on the slab caster. In each iteration, a random move
+    from one of the following neighborhoods is tried, and it is applied if it lowers the cost:
+        swap: exchange two runs
+        insertion: move one run to another position
+        block move: move a block of (at most `max_block`) consecutive runs to another position
+    Runs are moved over at most `max_distance` positions. Each move is evaluated incrementally (see
+    `SequenceState.delta`). The schedules for machine A and B are inferred from machine C, as in `sequence_to_schedule`.
+
+    Args:
+        solution: a complete solution
+        time_limit: the maximum running time in seconds, or `None` for no limit
+        max_iterations: the maximum number of moves to try, or `None` for no limit
+        max_distance: the maximum distance over which runs are moved
+        max_block: the maximum length of the block in a block move
+        seed: seed of the random number generator
+
+    Returns: the improved solution (`solution` itself is not modified)
+    """
+    assert time_limit is not None or max_iterations is not None, "at least one of the budgets must be given"
+
+    problem = solution.problem
+    steps_c = problem.run_steps[:, 2].tolist()
+    runs = sorted(range(len(problem.run_due)), key=lambda r: solution.start[steps_c[r]])
+    state = SequenceState(problem, runs)
+    n = len(runs)
+    if n < 2:
+        return state.to_solution()
+
+    rng = random.Random(seed)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    iteration = 0
+    while (max_iterations is None or iteration < max_iterations) \
+            and (deadline is None or iteration % 64 != 0 or time.perf_counter() < deadline):
+        iteration += 1
+
+        # every move rearranges the positions lo, ..., hi-1 into `middle`
+        kind = rng.randrange(3)
+        i = rng.randrange(n)
+        j = min(n - 1, max(0, i + rng.randint(-max_distance, max_distance)))
+        if i == j:
+            continue
+        lo, hi = min(i, j), max(i, j) + 1
+        current = state.runs[lo:hi]
+        if kind == 0:
+            # swap
+            middle = [current[-1]] + current[1:-1] + [current[0]]
+        elif kind == 1:
+            # insertion of run i at position j
+            middle = current[1:] + current[:1] if i < j else current[-1:] + current[:-1]
+        else:
+            # block move: exchange the block starting at lo with the runs after it
+            size = rng.randint(1, min(max_block, hi - lo - 1))
+            middle = current[size:] + current[:size]
+
+        if state.delta(lo, middle) < -1e-12:
+            state.apply(lo, middle)
+
+    return state.to_solution()
@@ -1,5 +1,7 @@
 from greedy_partitioner import *
 from data_structures import *
+from local_search import improve
+from metrics import Metrics
 
 # read problem
 problem = read_problem("data/input/data.csv")
@@ -10,7 +12,16 @@ problem = read_problem("data/input/data.csv")
 # print(feasibility(solution))
 
 # solve problem, compute cost, and check feasibility
-solution = solve(problem)
+# (use Metrics(verbose=True) to print the cost of every combination of clusters)
+metrics = Metrics()
+solution = solve(problem, metrics=metrics)
+for phase, timer in metrics.timers.items():
+    print(f"{phase}: {timer['seconds']:.3f}s")
+print(solution.cost())
+print(feasibility(solution))
+
+# improve the solution with a few seconds of local search
+solution = improve(solution, time_limit=2.0)
 print(solution.cost())
 print(feasibility(solution))
 
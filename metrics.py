@@ -0,0 +1,101 @@
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+
+class Metrics:
+    """
+    A class that collects timing data and statistics of a solver run, such as `greedy_partitioner.solve`. It is silent
+    unless `verbose` is set, and everything it collects can be exported with `summary` or `to_json`.
+
+    Attributes:
+        verbose: bool
+            Whether progress messages (see `log`) are printed
+        timers: dict[str, dict[str, float]]
+            For each phase, the total time spent in it (in seconds) and the number of times it was entered
+        counters: dict[str, int]
+            Named counters, for example the number of evaluated candidates
+        intervals: list[dict]
+            Statistics for each due date interval, such as the number of candidates, best cost and elapsed time
+        profile: cProfile.Profile | None
+            The profiler, if profiling is enabled
+    """
+
+    def __init__(self, verbose: bool = False, profile: bool = False, trace_memory: bool = False):
+        self.verbose: bool = verbose
+        self.timers: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, int] = {}
+        self.intervals: list[dict] = []
+        self.profile: cProfile.Profile | None = cProfile.Profile() if profile else None
+        self._trace_memory: bool = trace_memory
+        self._peak_memory: int | None = None
+
+    @contextlib.contextmanager
+    def timer(self, phase: str):
+        """Context manager that adds the time spent in its body to the timer of `phase`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(phase, {"seconds": 0.0, "calls": 0})
+            timer["seconds"] += time.perf_counter() - start
+            timer["calls"] += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Adds `amount` to the counter `name`."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def log(self, message: str) -> None:
+        """Prints `message` if this object is verbose."""
+        if self.verbose:
+            print(message)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """
+        Context manager for the whole run. If enabled, it profiles its body with cProfile and measures its peak memory
+        with tracemalloc (both slow the run down).
+        """
+        if self._trace_memory:
+            tracemalloc.start()
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            if self._trace_memory:
+                self._peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    def profile_stats(self, limit: int = 20, sort: str = "cumulative") -> str:
+        """Returns the `limit` most expensive functions of the profile as text (empty if profiling is disabled)."""
+        if self.profile is None:
+            return ""
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self) -> dict:
+        """Returns all collected data as a dictionary (which can be converted to JSON)."""
+        summary = {
+            "timers": self.timers,
+            "counters": self.counters,
+            "intervals": self.intervals,
+        }
+        if self._peak_memory is not None:
+            summary["peak_memory_bytes"] = self._peak_memory
+        return summary
+
+    def to_json(self, filename: str | None = None) -> str:
+        """Returns the summary as JSON, and writes it to `filename` if that is given."""
+        text = json.dumps(self.summary(), indent=2)
+        if filename is not None:
+            with open(filename, "w") as f:
+                f.write(text)
+        return text
@@ -1,6 +1,8 @@
 from data_structures import *
 from utils import *
 import greedy_partitioner
+import itertools
+import numpy as np
 
 
 def build_sequence(steps3_all: list[Step], permutations: list[list[int]] | None = None):
@@ -16,7 +18,7 @@ def build_sequence(steps3_all: list[Step], permutations: list[list[int]] | None
     seq = []
 
     # partition steps by due date
-    due_classes = group_by(steps3_all, lambda s: s.run.due)
+    due_classes = list_group_by(steps3_all, lambda s: s.run.due)
 
     if permutations is None:
         permutations = [None] * len(due_classes)
@@ -44,33 +46,89 @@ def build_sequence(steps3_all: list[Step], permutations: list[list[int]] | None
     return seq
 
 
-problem = read_problem()
-
-best_solution: Solution | None = None
-best_cost: float | None = None
+class _State:
+    """
+    A partial schedule in the dynamic program of `solve_optimal_permutations`: the permutations chosen for the intervals
+    so far, their total cost, and the frontier of the resulting schedule.
+    """
 
-# create all possible permutations for the metal groups (in each due date interval)
-# there are two intervals, so the total set of options if the product of all permutations
-metal_permutations = list(itertools.permutations(range(3)))
-print(f"we will consider {len(metal_permutations)**2} permutations")
-for p1, p2 in itertools.product(metal_permutations, metal_permutations):
-    # build sequence using the above function
-    sequence = build_sequence(
-        [s for s in problem.steps if s.phase() == 2],
-        [p1, p2]
-    )
+    def __init__(self, permutations: list[tuple[int, ...]], cost: float, frontier: Frontier):
+        self.permutations: list[tuple[int, ...]] = permutations
+        self.cost: float = cost
+        self.frontier: Frontier = frontier
+
+    def dominates(self, other: "_State") -> bool:
+        """
+        Returns whether this state is at least as good as `other`: it ends with the same metal, it is not more
+        expensive, and each machine is free no later. Any continuation of `other` then costs at least as much as the same
+        continuation of this state.
+        """
+        return self.frontier.metal == other.frontier.metal \
+            and self.cost <= other.cost \
+            and all(e1 <= e2 for e1, e2 in zip(self.frontier.end, other.frontier.end))
+
+
+def _prune(states: list[_State]) -> list[_State]:
+    """Removes all states that are dominated by another state. The order of the remaining states is preserved."""
+    kept: list[_State] = []
+    for state in sorted(states, key=lambda s: s.cost):  # stable, so ties keep their order
+        if not any(k.dominates(state) for k in kept):
+            kept.append(state)
+    order = {id(s): i for i, s in enumerate(states)}
+    return sorted(kept, key=lambda s: order[id(s)])
+
+
+def solve_optimal_permutations(problem: Problem) -> tuple[Solution, float]:
+    """
+    Finds the best schedule among those of `build_sequence` with permutations, i.e., in each due date interval the steps
+    are grouped by metal, each group is sorted by step length, and the groups can be put in any order.
 
-    # create schedule from sequence and compute cost
-    solution = Solution(problem)  # empty
-    solution = greedy_partitioner.sequence_to_schedule(solution, sequence)
-    cost = solution.cost()
+    Instead of trying all combinations of permutations (of which there are (m!)^d for m metals and d due dates), this
+    uses dynamic programming over the intervals. A state is a schedule up to some interval, which is characterised by
+    its cost and frontier (i.e., end times of the machines and metal on the slab caster). Each state is extended with
+    every permutation of the next interval, evaluated all at once by `greedy_partitioner.time_sequences`. Then states
+    that are dominated by another state (see `_State.dominates`) are removed, since they cannot lead to a better
+    schedule.
 
-    print(f"with permutations [{','.join([str(x) for x in p1])}] and [{','.join([str(x) for x in p2])}], cost = {cost}")
+    :return: An optimal schedule (within this class of schedules) and its cost.
+    """
 
-    # keep track of best solution
-    if best_cost is None or cost < best_cost:
-        best_solution = solution
-        best_cost = cost
+    steps3_all = [s for s in problem.steps if s.phase() == 2]
+    states = [_State([], 0.0, Frontier())]
 
-print(best_cost)
-write_solution(best_solution, "greedy_solution.csv")
+    for steps3_due in list_group_by(steps3_all, lambda s: s.run.due):
+        # partition steps by metal
+        # and then sort each subset from smallest to largest length
+        steps3_metal: list[list[Step]] = [
+            sorted(steps, key=lambda s: s.length)
+            for steps in group_by(steps3_due, lambda s: s.run.metal)
+        ]
+        permutations = list(itertools.permutations(range(len(steps3_metal))))
+        sequences = np.array([
+            [s.index for steps in apply_permutation(steps3_metal, perm) for s in steps]
+            for perm in permutations
+        ])
+
+        # extend every state with every permutation
+        new_states = []
+        for state in states:
+            end, lateness, setups = greedy_partitioner.time_sequences(problem, sequences, state.frontier)
+            costs = lateness / (7 * 24 * 3600) + setups
+            for i, perm in enumerate(permutations):
+                metal = steps3_metal[perm[-1]][-1].run.metal
+                frontier = Frontier(end[i, -1].tolist(), metal)
+                new_states.append(_State(state.permutations + [perm], state.cost + costs[i], frontier))
+
+        states = _prune(new_states)
+
+    best = min(states, key=lambda s: s.cost)  # the first one in case of ties
+    solution, _ = greedy_partitioner.sequence_to_schedule(Solution(problem), build_sequence(steps3_all, best.permutations))
+    return solution, float(best.cost)
+
+
+if __name__ == "__main__":
+    problem = read_problem()
+    best_solution, best_cost = solve_optimal_permutations(problem)
+
+    print(best_cost)
+    write_solution(best_solution, "greedy_solution.csv")
@@ -1,86 +1,246 @@
-import time
-import plotly.express as px
+"""
+Visualisation of schedules as Gantt charts (with Plotly). The data of a schedule is first joined into one dataframe
+with `schedule_frame` (from csv files) or `solution_frame` (from a Solution), which can then be plotted several times:
+
+    frame = schedule_frame(pd.read_csv("data/input/data.csv"), pd.read_csv("greedy_solution.csv"))
+    plot_schedule(frame).show("browser")                              # whole horizon
+    plot_schedule(frame, window=(172800, 259200)).show("browser")     # one day, in seconds
+    plot_summary(frame).show("browser")                               # utilization and lateness per due date
+
+The steps are drawn with WebGL, and when there are more than `max_steps` steps in view, consecutive steps with the same
+metal (and lateness) on a machine are drawn as one block, so that large schedules stay responsive.
+
+    python schedule_visualisation.py data/input/data.csv greedy_solution.csv [--window 48 72] [--summary]
+"""
+
+import argparse
+
+import numpy as np
 import pandas as pd
-import datetime as dt
 import plotly.graph_objects as go
-
-problem_csv = "data/input/random_data.csv"
-solution_csv = "greedy_solution.csv"
-
-df_solution = pd.read_csv(solution_csv)
-df_problem = pd.read_csv(problem_csv)
-
-df_problem["metal"] = df_problem["metal"].astype(str)
-
-df_steps = []
-for i in range(1,4):
-   df_step_i = df_problem[[f"step{i}", f"len{i}", "metal", "due"]].copy()
-   df_step_i.columns = ["StepId", "length", "metal", "due"]
-   df_steps.append(df_step_i)
-df_step = pd.concat(df_steps)
-
-df_solution = df_solution.join(df_step.set_index("StepId"), on="StepId")
-
-start_date = pd.to_datetime("2023-11-06")
-df_solution["Start"] = start_date + pd.to_timedelta(df_solution['StartDate_Seconds'], unit='s')
-df_solution["End"] = start_date + pd.to_timedelta(df_solution['EndDate_Seconds'], unit='s')
-df_solution["Machine"] = df_solution["StepId"].str.get(0)
-
-mask_setup_times = df_solution["SetupTime_Hours"] > 0
-
-#DataFrame for just the setup times
-df_setup_times = df_solution[mask_setup_times].copy()
-df_setup_times["End"] = df_setup_times["Start"] + pd.to_timedelta(df_setup_times["SetupTime_Hours"], unit='h')
-
-#Shorten the "Step" into its actual Step time (excluding setup time_
-df_solution["Start"] = df_solution["Start"] + pd.to_timedelta(df_solution["SetupTime_Hours"], unit='h')
-
-actual_start_time = df_solution["Start"].min()
-
-df_solution_ontime = df_solution[df_solution["TooLate_Weeks"] == 0].copy()
-df_solution_late = df_solution[df_solution["TooLate_Weeks"] != 0].copy()
-
-fig_ontime = px.timeline(df_solution_ontime,
-                  x_start="Start",
-                  x_end="End",
-                  y="Machine",
-                  color = "metal",
-                  color_discrete_map={"0": '#ff0000', "1": '#4467C4', "2": '#1fc600'},
-                  hover_data=["StepId", "TooLate_Weeks", "SetupTime_Hours", "StartDate_Seconds", "StartDate_Seconds", "due"],
-                  range_x=(actual_start_time, actual_start_time + pd.to_timedelta(3600*24, unit='s')))
-fig_ontime.update_yaxes(autorange="reversed", fixedrange=True)
-
-fig_late = px.timeline(df_solution_late,
-                  x_start="Start",
-                  x_end="End",
-                  y="Machine",
-                  color = "metal",
-                  color_discrete_map={"0": '#b10000', "1": '#00008C', "2": '#0a5d00'},
-                  hover_data=["StepId", "TooLate_Weeks", "SetupTime_Hours", "StartDate_Seconds", "StartDate_Seconds"]
-                       )
-
-fig_setup = px.timeline(df_setup_times,
-                        x_start="Start",
-                        x_end="End",
-                        y="Machine",
-                        color="metal",
-                        hover_data=["StepId", "TooLate_Weeks", "SetupTime_Hours"],
-                        color_discrete_map={metal_type: "silver" for metal_type in df_setup_times["metal"].unique()})
-
-# df_solution_lines = df_solution.copy()
-# df_solution_lines["Duration"] = (df_solution_lines["End"] - df_solution_lines["Start"]).dt.seconds
-# df_solution_lines["X"] = df_solution_lines["Start"] + pd.to_timedelta(df_solution_lines["Duration"]/2.0, unit='s')
-#
-# fig_lines = px.line(df_solution_lines,
-#                     x="X",
-#                     y="Machine",
-#                     color="RunId",
-#                     color_discrete_map={x: "black" for x in df_solution_lines["RunId"].unique()})
-
-
-new_fig = go.Figure(data=fig_ontime.data + fig_late.data + fig_setup.data, layout=fig_ontime.layout)
-new_fig.update_layout(title=f"Schedule {solution_csv}")
-for due_date_seconds in df_solution["due"].unique():
-    new_fig.add_vline(start_date + pd.to_timedelta(due_date_seconds, unit='s'))
-
-new_fig.show("browser")
+from plotly.subplots import make_subplots
+
+START_DATE = pd.Timestamp("2023-11-06")
+
+# colours of the metals for runs that are on time and late, and of setups
+COLORS_ON_TIME = {0: "#ff0000", 1: "#4467C4", 2: "#1fc600"}
+COLORS_LATE = {0: "#b10000", 1: "#00008C", 2: "#0a5d00"}
+COLOR_SETUP = "silver"
+FALLBACK_COLORS = ["#ff7f0e", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"]
+
+MACHINES = ["A", "B", "C"]
+
+# maximum number of time buckets in the utilization plot of `plot_summary` (by default)
+MAX_BUCKETS = 500
+
+
+def schedule_frame(df_problem: pd.DataFrame, df_solution: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins a problem (in our csv format, see `read_problem`) and a solution (in the format of `write_solution`) into one
+    dataframe with one row per step, sorted by machine and start time. Besides the columns of the solution, it has the
+    columns Machine, length, metal, due, late, and the times (in seconds) setup_start, start and end, where the step
+    itself takes place between start and end and a setup (if any) between setup_start and start.
+    """
+    columns = ["StepId", "length", "metal", "due"]
+    steps = pd.concat([
+        df_problem[[f"step{i}", f"len{i}", "metal", "due"]].set_axis(columns, axis=1) for i in range(1, 4)
+    ])
+    frame = df_solution.merge(steps, on="StepId", how="left", validate="one_to_one")
+    if frame["metal"].isna().any():
+        raise KeyError(frame["StepId"][frame["metal"].isna()].iloc[0])
+
+    frame["Machine"] = frame["StepId"].str[0]
+    frame["setup_start"] = frame["StartDate_Seconds"]
+    frame["start"] = frame["StartDate_Seconds"] + 3600 * frame["SetupTime_Hours"]
+    frame["end"] = frame["start"] + frame["length"]
+    frame["late"] = frame["TooLate_Weeks"] > 0
+    return frame.sort_values(["Machine", "start"], kind="stable").reset_index(drop=True)
+
+
+def solution_frame(solution) -> pd.DataFrame:
+    """Same as `schedule_frame`, but for a Solution object (so without writing and reading csv files)."""
+    from data_structures import problem_to_dataframe, solution_to_dataframe
+
+    return schedule_frame(problem_to_dataframe(solution.problem), solution_to_dataframe(solution))
+
+
+def aggregate_blocks(frame: pd.DataFrame, max_gap: float | None = None) -> pd.DataFrame:
+    """
+    Merges consecutive steps on the same machine with the same metal and lateness into blocks, for plotting at coarse
+    zoom. A block spans from the start of its first step to the end of its last step; if `max_gap` is given, steps
+    that are more than `max_gap` seconds apart are not merged. `frame` must be sorted as by `schedule_frame`.
+    Returns a dataframe with one row per block and the columns Machine, metal, late, setup_start, start, end, steps,
+    first and last (the StepIds of the first and last step).
+    """
+    machine, metal, late = frame["Machine"].to_numpy(), frame["metal"].to_numpy(), frame["late"].to_numpy()
+    new_block = np.ones(len(frame), dtype=bool)
+    new_block[1:] = (machine[1:] != machine[:-1]) | (metal[1:] != metal[:-1]) | (late[1:] != late[:-1])
+    if max_gap is not None:
+        gap = frame["setup_start"].to_numpy()[1:] - frame["end"].to_numpy()[:-1]
+        new_block[1:] |= gap > max_gap
+
+    return frame.groupby(np.cumsum(new_block)).agg(
+        Machine=("Machine", "first"),
+        metal=("metal", "first"),
+        late=("late", "first"),
+        setup_start=("setup_start", "first"),
+        start=("start", "first"),
+        end=("end", "last"),
+        steps=("StepId", "size"),
+        first=("StepId", "first"),
+        last=("StepId", "last"),
+    ).reset_index(drop=True)
+
+
+def _to_date(seconds) -> np.ndarray:
+    """Converts times in seconds to milliseconds since the epoch, which plotly shows as dates on a date axis."""
+    return (START_DATE.value // 10**6) + 1000 * np.asarray(seconds, dtype=np.float64)
+
+
+def _segments(start, end, machine, text, name: str, color: str, width: float) -> go.Scattergl:
+    """A WebGL trace that draws the bars [start, end] as thick horizontal line segments, separated by gaps."""
+    n = len(start)
+    x = np.full(3 * n, np.nan)
+    x[0::3], x[1::3] = _to_date(start), _to_date(end)
+    y = np.full(3 * n, None, dtype=object)
+    y[0::3] = y[1::3] = np.asarray(machine)
+    hover = np.full(3 * n, None, dtype=object)
+    hover[0::3] = hover[1::3] = np.asarray(text)
+    return go.Scattergl(x=x, y=y, text=hover, mode="lines", name=name, line=dict(color=color, width=width),
+                        hovertemplate="%{text}<extra></extra>", connectgaps=False)
+
+
+def _metal_color(metal: int, late: bool) -> str:
+    colors = COLORS_LATE if late else COLORS_ON_TIME
+    return colors.get(metal, FALLBACK_COLORS[metal % len(FALLBACK_COLORS)])
+
+
+def plot_schedule(frame: pd.DataFrame, window: tuple[float, float] | None = None, detail: str = "auto",
+                  max_steps: int = 20000, max_gap: float | None = None, width: float = 20,
+                  title: str | None = None) -> go.Figure:
+    """
+    Draws a Gantt chart of the schedule in `frame` (see `schedule_frame`), with a row per machine, the steps coloured by
+    metal (darker if late), setups in silver, and a vertical line at each due date.
+
+    Args:
+        frame: the schedule
+        window: if given, only the steps in this time window (in seconds) are drawn
+        detail: "steps" to draw every step, "blocks" to draw blocks of steps (see `aggregate_blocks`), or "auto" to
+            draw blocks only when there are more than `max_steps` steps in the window
+        max_steps: see `detail`
+        max_gap: see `aggregate_blocks`
+        width: the height of the bars in pixels
+        title: the title of the figure
+
+    Returns: the figure
+    """
+    if window is not None:
+        frame = frame[(frame["end"] > window[0]) & (frame["setup_start"] < window[1])]
+    if detail not in ("auto", "steps", "blocks"):
+        raise ValueError(f"unknown level of detail {detail}")
+    blocks = detail == "blocks" or (detail == "auto" and len(frame) > max_steps)
+
+    if blocks:
+        bars = aggregate_blocks(frame, max_gap)
+        text = np.where(bars["steps"] == 1, bars["first"],
+                        bars["first"] + " - " + bars["last"] + " (" + bars["steps"].astype(str) + " steps)")
+    else:
+        bars = frame
+        text = bars["StepId"] + ", due " + bars["due"].astype(str) + ", too late " + \
+            bars["TooLate_Weeks"].round(3).astype(str) + " weeks"
+    text = pd.Series(text, index=bars.index)
+
+    traces = []
+    for (late, metal), group in bars.groupby(["late", "metal"]):
+        name = f"metal {metal}" + (" (late)" if late else "")
+        traces.append(_segments(group["start"], group["end"], group["Machine"], text[group.index], name,
+                                _metal_color(int(metal), late), width))
+    setups = bars[bars["setup_start"] < bars["start"]]
+    if len(setups) > 0:
+        traces.append(_segments(setups["setup_start"], setups["start"], setups["Machine"],
+                                np.full(len(setups), "setup"), "setup", COLOR_SETUP, width))
+
+    fig = go.Figure(data=traces)
+    fig.update_xaxes(type="date")
+    fig.update_yaxes(categoryorder="array", categoryarray=MACHINES[::-1], fixedrange=True)
+    if window is not None:
+        fig.update_xaxes(range=list(_to_date(window)))
+    for due in np.unique(frame["due"]):
+        fig.add_vline(_to_date(due), line_color="black")
+    fig.update_layout(title=title)
+    return fig
+
+
+def utilization(frame: pd.DataFrame, bucket: float | None = None) -> pd.DataFrame:
+    """
+    Returns for each machine and each time bucket of `bucket` seconds the fraction of time that the machine is busy
+    (including setups), with one column per machine and the start of the buckets (in seconds) as index. By default,
+    the buckets are whole days, with at most `MAX_BUCKETS` buckets over the horizon.
+    """
+    horizon = frame["end"].max() if len(frame) > 0 else 0
+    if bucket is None:
+        bucket = 24 * 3600 * max(1, -(-horizon // (24 * 3600 * MAX_BUCKETS)))
+    edges = np.arange(0, horizon + bucket, bucket, dtype=np.float64)
+    result = {}
+    for machine, steps in frame.groupby("Machine"):
+        # the steps on a machine do not overlap, so at most one step is running at each edge
+        start, end = steps["setup_start"].to_numpy(dtype=np.float64), steps["end"].to_numpy(dtype=np.float64)
+        busy = np.concatenate([[0], np.cumsum(end - start)])
+        done = np.searchsorted(end, edges, side="right")  # number of steps that finished before each edge
+        running = np.minimum(done, len(start) - 1)
+        partial = np.where((done < len(start)) & (start[running] < edges), edges - start[running], 0)
+        result[machine] = np.diff(busy[done] + partial) / bucket
+    return pd.DataFrame(result, index=pd.Index(edges[:-1], name="time"))
+
+
+def lateness_per_due_date(frame: pd.DataFrame) -> pd.DataFrame:
+    """Returns for each due date the number of runs, the number of late runs, and their total lateness in weeks."""
+    last_steps = frame[frame["Machine"] == "C"]
+    return last_steps.groupby("due").agg(runs=("StepId", "size"), late_runs=("late", "sum"),
+                                         lateness_weeks=("TooLate_Weeks", "sum"))
+
+
+def plot_summary(frame: pd.DataFrame, bucket: float | None = None, title: str | None = None) -> go.Figure:
+    """
+    Draws a summary of the schedule in `frame` (see `schedule_frame`): the utilization of each machine per time bucket
+    (see `utilization`), and the lateness per due date (see `lateness_per_due_date`).
+    """
+    busy = utilization(frame, bucket)
+    late = lateness_per_due_date(frame)
+
+    fig = make_subplots(rows=2, cols=1, subplot_titles=["Utilization", "Lateness per due date"], vertical_spacing=0.15)
+    for machine in busy.columns:
+        fig.add_trace(go.Scatter(x=_to_date(busy.index), y=busy[machine], name=f"machine {machine}",
+                                 mode="lines", line_shape="hv"), row=1, col=1)
+    fig.add_trace(go.Bar(x=_to_date(late.index), y=late["lateness_weeks"], name="lateness (weeks)",
+                         customdata=late[["late_runs", "runs"]].to_numpy(),
+                         hovertemplate="%{y:.3f} weeks, %{customdata[0]} of %{customdata[1]} runs late"),
+                  row=2, col=1)
+    fig.update_xaxes(type="date")
+    fig.update_yaxes(range=[0, 1.05], tickformat=".0%", row=1, col=1)
+    fig.update_layout(title=title)
+    return fig
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("problem", help="problem csv file")
+    parser.add_argument("solution", help="solution csv file")
+    parser.add_argument("--window", type=float, nargs=2, metavar=("START", "END"),
+                        help="only show this time window (in hours since the start of the horizon)")
+    parser.add_argument("--detail", default="auto", choices=["auto", "steps", "blocks"], help="level of detail")
+    parser.add_argument("--summary", action="store_true", help="show the utilization and lateness instead")
+    parser.add_argument("--output", help="write the figure to this html file instead of opening it in the browser")
+    args = parser.parse_args()
+
+    frame = schedule_frame(pd.read_csv(args.problem), pd.read_csv(args.solution))
+    if args.summary:
+        fig = plot_summary(frame, title=f"Summary {args.solution}")
+    else:
+        window = None if args.window is None else (args.window[0] * 3600, args.window[1] * 3600)
+        fig = plot_schedule(frame, window, args.detail, title=f"Schedule {args.solution}")
+
+    if args.output is not None:
+        fig.write_html(args.output, include_plotlyjs="cdn")
+    else:
+        fig.show("browser")
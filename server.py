@@ -0,0 +1,302 @@
+"""
+A resident solver service. Starting Python and importing pandas, NumPy and the solver takes much longer than solving a
+small instance, so this process is started once and keeps everything loaded. It accepts jobs over a Unix socket (or a
+TCP port on localhost), runs them from a queue with a limited number of workers, and caches parsed problems by the hash
+of their file.
+
+    python server.py --socket /tmp/scheduler.sock --workers 2
+
+The protocol is one JSON object per line in both directions. A request has an "op" field:
+    submit: {"op": "submit", "kind": "solve", "problem": "data/input/data.csv", "output": "solution.csv",
+             "options": {"time_limit": 10}}  ->  {"ok": true, "job": {...}}
+            kinds are "solve" (optionally writing the solution to "output"), "feasibility" and "cost" (both of the
+            solution csv file given as "solution")
+    status: {"op": "status", "id": 3}  ->  {"ok": true, "job": {...}}, with the result once the job is done
+    cancel: {"op": "cancel", "id": 3}  ->  {"ok": true, "job": {...}}
+    stats:  {"op": "stats"}  ->  {"ok": true, "queued": ..., "running": ..., "cache": {...}}
+Errors are reported as {"ok": false, "error": "..."}. `request` sends one request from Python.
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+from data_structures import *
+from greedy_partitioner import solve
+from metrics import Metrics
+
+JOB_KINDS = {"solve", "feasibility", "cost"}
+
+# options of `solve` that can be given in a solve job
+SOLVE_OPTIONS = {"time_limit", "interval_budget", "max_clusters", "search"}
+
+
+class Job:
+    """
+    A class representing a job of the service.
+
+    Attributes:
+        id: int
+            The number of the job
+        kind: str
+            What the job does, see JOB_KINDS
+        params: dict
+            The parameters of the job (file names and options)
+        status: str
+            One of "queued", "running", "done", "failed" and "cancelled"
+        result: dict | None
+            The result of a finished job, such as the cost of the solution
+        error: str | None
+            The error message of a failed job
+        cancel: threading.Event
+            Set when the job is cancelled, which also stops a running solve
+    """
+
+    def __init__(self, id: int, kind: str, params: dict):
+        self.id: int = id
+        self.kind: str = kind
+        self.params: dict = params
+        self.status: str = "queued"
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.cancel: threading.Event = threading.Event()
+        self.submitted: float = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "kind": self.kind, "params": self.params, "status": self.status,
+            "result": self.result, "error": self.error,
+            "submitted": self.submitted, "started": self.started, "finished": self.finished,
+        }
+
+
+class SolverService:
+    """
+    A class that runs jobs from a queue. At most `workers` jobs run at the same time, each in a thread of its own, and
+    at most `max_queue` jobs wait in the queue. Parsed problems are cached by the hash of their file (the
+    `cache_size` most recently used ones are kept). Finished jobs are kept for `status` requests, up to `max_jobs`.
+
+    Jobs run in threads rather than processes, so that they share the problem cache and can be cancelled (see `solve`).
+    The solver holds the GIL for much of its running time, so more workers mostly help when jobs wait on I/O.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 100, cache_size: int = 8, max_jobs: int = 1000):
+        self.workers: int = workers
+        self.max_jobs: int = max_jobs
+        self.jobs: collections.OrderedDict[int, Job] = collections.OrderedDict()
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self._queue: asyncio.Queue | None = None
+        self._max_queue: int = max_queue
+        self._ids = itertools.count(1)
+        self._cache: collections.OrderedDict[str, Problem] = collections.OrderedDict()
+        self._cache_size: int = cache_size
+        self._cache_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+    def problem(self, filename: str) -> Problem:
+        """Returns the problem in the csv file `filename`, parsing it only if a file with the same contents was not."""
+        key = file_hash(filename)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+        problem = read_problem(filename)
+        with self._cache_lock:
+            self.cache_misses += 1
+            self._cache[key] = problem
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return problem
+
+    def submit(self, kind: str, params: dict) -> Job:
+        """Adds a job to the queue. Raises a ValueError if the job is invalid or the queue is full."""
+        if not isinstance(kind, str) or kind not in JOB_KINDS:
+            raise ValueError(f"unknown job kind {kind}, expected one of {sorted(JOB_KINDS)}")
+        if "problem" not in params or (kind != "solve" and "solution" not in params):
+            raise ValueError(f"a {kind} job needs a problem" + ("" if kind == "solve" else " and a solution"))
+        for name in ("problem", "solution", "output"):
+            if params.get(name) is not None and not isinstance(params[name], str):
+                raise ValueError(f"{name} must be a file name")
+        options = params.get("options", {})
+        if not isinstance(options, dict):
+            raise ValueError("options must be an object")
+        unknown = set(options) - SOLVE_OPTIONS
+        if unknown:
+            raise ValueError(f"unknown options {sorted(unknown)}")
+
+        job = Job(next(self._ids), kind, params)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise ValueError("the queue is full")
+        self.jobs[job.id] = job
+        # forget the oldest finished jobs
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status in ("queued", "running"):
+                break
+            self.jobs.popitem(last=False)
+        return job
+
+    def job(self, id: int) -> Job:
+        if not isinstance(id, int) or id not in self.jobs:
+            raise ValueError(f"unknown job {id}")
+        return self.jobs[id]
+
+    def cancel(self, id: int) -> Job:
+        """Cancels a job. A queued job will not be started, and a running solve stops at its next check."""
+        job = self.job(id)
+        if job.status in ("queued", "running"):
+            job.cancel.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+        return job
+
+    def stats(self) -> dict:
+        statuses = collections.Counter(job.status for job in self.jobs.values())
+        return {
+            "workers": self.workers,
+            "queued": statuses["queued"],
+            "running": statuses["running"],
+            "jobs": dict(statuses),
+            "cache": {"problems": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses},
+        }
+
+    def _run(self, job: Job) -> dict | None:
+        """Runs `job` (in a worker thread) and returns its result (`None` if it was cancelled)."""
+        params = job.params
+        problem = self.problem(params["problem"])
+
+        if job.kind == "solve":
+            metrics = Metrics()
+            solution = solve(problem, metrics=metrics, cancel=job.cancel, **params.get("options", {}))
+            if job.cancel.is_set():
+                return None
+            if params.get("output") is not None:
+                write_solution(solution, params["output"])
+            return {"cost": solution.cost(), "feasible": is_feasible(solution), "metrics": metrics.summary()}
+
+        solution = parse_solution(problem, pd.read_csv(params["solution"]))
+        if job.kind == "cost":
+            return {"cost": solution.cost()}
+        report = feasibility_report(solution)
+        return {"feasible": len(report) == 0, "violations": report["rule"].value_counts().to_dict()}
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancel.is_set():
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                try:
+                    job.result = await loop.run_in_executor(self._executor, self._run, job)
+                    job.status = "cancelled" if job.cancel.is_set() else "done"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = f"{type(e).__name__}: {e}"
+                job.finished = time.time()
+            finally:
+                self._queue.task_done()
+
+    def handle_request(self, request: dict) -> dict:
+        """Answers one request of the protocol (see the module docstring). Invalid requests get an error response."""
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "a request must be a JSON object"}
+        try:
+            op = request.get("op")
+            if op == "submit":
+                params = {k: v for k, v in request.items() if k not in ("op", "kind")}
+                return {"ok": True, "job": self.submit(request.get("kind"), params).to_dict()}
+            if op == "status":
+                return {"ok": True, "job": self.job(request.get("id")).to_dict()}
+            if op == "cancel":
+                return {"ok": True, "job": self.cancel(request.get("id")).to_dict()}
+            if op == "stats":
+                return {"ok": True, **self.stats()}
+            raise ValueError(f"unknown op {op}")
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    response = self.handle_request(json.loads(line))
+                except json.JSONDecodeError as e:
+                    response = {"ok": False, "error": f"invalid JSON: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path: str | None = None, port: int | None = None) -> None:
+        """Serves requests on the Unix socket `path`, or on `port` of localhost, until the task is cancelled."""
+        self._queue = asyncio.Queue(self._max_queue)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if path is not None:
+            # remove the socket of an earlier run, but never another kind of file
+            if os.path.exists(path):
+                if not stat.S_ISSOCK(os.stat(path).st_mode):
+                    raise FileExistsError(f"{path} exists and is not a socket")
+                os.remove(path)
+            server = await asyncio.start_unix_server(self._handle_connection, path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, "127.0.0.1", port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for w in workers:
+                w.cancel()
+            for job in self.jobs.values():
+                job.cancel.set()
+            self._executor.shutdown(wait=False)
+
+
+def request(message: dict, path: str | None = None, port: int | None = None) -> dict:
+    """
+    Sends one request to a running service, on the Unix socket `path` or on `port` of localhost, and returns the
+    response.
+    """
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection(("127.0.0.1", port))
+    with connection, connection.makefile("rwb") as f:
+        f.write(json.dumps(message).encode() + b"\n")
+        f.flush()
+        return json.loads(f.readline())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", help="path of the Unix socket to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port on localhost to listen on (without --socket)")
+    parser.add_argument("--workers", type=int, default=2, help="maximum number of jobs that run at the same time")
+    parser.add_argument("--max-queue", type=int, default=100, help="maximum number of waiting jobs")
+    parser.add_argument("--cache-size", type=int, default=8, help="number of parsed problems that are kept")
+    args = parser.parse_args()
+
+    service = SolverService(args.workers, args.max_queue, args.cache_size)
+    try:
+        asyncio.run(service.serve(args.socket, None if args.socket else args.port))
+    except KeyboardInterrupt:
+        pass
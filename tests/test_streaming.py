@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_structures import read_problem, write_solution
+from greedy_partitioner import solve, solve_to_csv
+
+DATA_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input", "data.csv")
+
+
+def solve_both(df: pd.DataFrame, directory) -> tuple[str, str]:
+    """Solves the problem `df` with `solve` and with `solve_to_csv`, and returns the contents of both solution files."""
+    problem_csv = os.path.join(directory, "problem.csv")
+    df.to_csv(problem_csv, index=False)
+    solution_csv = os.path.join(directory, "solution.csv")
+    stream_csv = os.path.join(directory, "stream.csv")
+    write_solution(solve(read_problem(problem_csv)), solution_csv)
+    solve_to_csv(problem_csv, stream_csv)
+    with open(solution_csv) as f, open(stream_csv) as g:
+        return f.read(), g.read()
+
+
+def test_stream_with_on_time_and_late_intervals(tmp_path):
+    # the first interval is on time and the second one is late
+    df = pd.read_csv(DATA_CSV)
+    df["due"] = 300001
+    df.loc[:1, "due"] = 300000
+    solution, stream = solve_both(df, tmp_path)
+    assert "0,A001,0,2746,0.0,0" in solution.splitlines()
+    assert stream == solution
+
+
+def test_stream_without_late_runs(tmp_path):
+    # write_solution writes the lateness as integers if no run is late, the stream always as floats
+    df = pd.read_csv(DATA_CSV).head(2)
+    df["due"] = 10 ** 9
+    solution, stream = solve_both(df, tmp_path)
+    assert ",0.0," not in solution
+    assert stream.replace(",0.0,", ",0,") == solution